@@ -0,0 +1,394 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from sudoku_io import read_puzzles
+from sudoku_solver import SearchStats, check_board, engines, orderings, sudoku_solver
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                    BENCHMARK FUNCTIONS                     #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+benchmark_directory = os.path.dirname(os.path.abspath(__file__))
+corpora_directory = os.path.join(benchmark_directory, "corpora")
+default_baseline = os.path.join(benchmark_directory, "baseline.json")
+default_output = os.path.join(benchmark_directory, "results.json")
+
+# Corpus tiers in report order, mapped to whether their puzzles
+# have a solution. Every tier is a corpora/<tier>.txt file in
+# the 81 character per line format of sudoku_io.
+tiers = {"easy": True, "medium": True, "hard": True, "17-clue": True,
+         "invalid": False, "unsolvable": False}
+
+# Metrics compared against the baseline, mapped to whether a
+# higher value is better. Max latency is reported but not
+# compared, a single slow puzzle is too noisy to gate on.
+compared_metrics = {"puzzles_per_second": True, "p50_ms": False, "p95_ms": False,
+                    "p99_ms": False, "peak_memory_kb": False}
+
+# Puzzles a tier needs before a percentile is compared, so that
+# at least one puzzle lies above it. On smaller tiers the
+# percentile is the slowest puzzle, as noisy as the max.
+percentile_samples = {"p50_ms": 2, "p95_ms": 20, "p99_ms": 100}
+
+# Slowdown every compared tier of the baseline must be flagged at
+slowdown_factor = 2.0
+
+# Engines run by default, the numpy CSP search takes hours on
+# the hard tiers and is only run when asked for
+default_engines = ["bitmask", "dlx"]
+
+#------------------------------------------------------------#
+#            Function to load the puzzles of a tier          #
+#------------------------------------------------------------#
+#  - Takes tier name as input                                #
+#  - Returns (N, 9, 9) array of puzzles                      #
+#------------------------------------------------------------#
+
+
+def load_corpus(tier):
+    with open(os.path.join(corpora_directory, tier + ".txt")) as corpus_file:
+        return np.array(list(read_puzzles(corpus_file)))
+
+#------------------------------------------------------------#
+#          Function to time one sweep over a tier            #
+#------------------------------------------------------------#
+#  - Takes puzzles, engine, latencies and solutions arrays   #
+#    and ordering name as input                              #
+#  - Solves every puzzle once, keeping the faster of its     #
+#    time and the latency stored so far, and stores the      #
+#    solution                                                #
+#------------------------------------------------------------#
+
+
+def sweep_tier(puzzles, engine, latencies, solutions, order=None):
+    for i, puzzle in enumerate(puzzles):
+        board = puzzle.copy()
+        start = time.perf_counter()
+        solutions[i] = sudoku_solver(board, engine=engine, order=order)
+        latencies[i] = min(latencies[i], time.perf_counter() - start)
+
+#------------------------------------------------------------#
+#        Function to benchmark one engine on one tier        #
+#------------------------------------------------------------#
+#  - Takes puzzles, engine, solvable flag, the fastest       #
+#    latencies and the solutions of the timed sweeps, memory #
+#    flag and ordering name as input                         #
+#  - Results that are not a valid solution of a solvable     #
+#    puzzle, or not all -1 for the others, are counted as    #
+#    errors                                                  #
+#  - Search decisions come from a second, untraced pass and  #
+#    peak memory, the largest traced allocation, from a      #
+#    third pass without statistics, so the statistics slow   #
+#    neither the timed nor the traced pass                   #
+#  - Returns dictionary of metrics                           #
+#------------------------------------------------------------#
+
+
+def run_tier(puzzles, engine, solvable, latencies, solutions, memory=True, order=None):
+    errors = 0
+    for puzzle, solution in zip(puzzles, solutions):
+        if solvable:
+            givens = puzzle != 0
+            correct = check_board(solution) and np.array_equal(solution[givens], puzzle[givens])
+        else:
+            correct = np.all(solution == -1)
+        errors += not correct
+
+    decisions = 0
+    stats = SearchStats()
+    for puzzle in puzzles:
+        sudoku_solver(puzzle.copy(), engine=engine, stats=stats, order=order)
+        decisions += stats.decisions
+
+    peak_memory = None
+    if memory:
+        tracemalloc.start()
+        for puzzle in puzzles:
+            sudoku_solver(puzzle.copy(), engine=engine, order=order)
+        peak_memory = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+
+    milliseconds = latencies * 1000
+    total = latencies.sum()
+    return {"puzzles": len(puzzles),
+            "errors": errors,
+            "puzzles_per_second": len(puzzles) / total if total else 0.0,
+            "p50_ms": float(np.percentile(milliseconds, 50)),
+            "p95_ms": float(np.percentile(milliseconds, 95)),
+            "p99_ms": float(np.percentile(milliseconds, 99)),
+            "max_ms": float(milliseconds.max()),
+            "mean_decisions": decisions / len(puzzles),
+            "peak_memory_kb": peak_memory}
+
+#------------------------------------------------------------#
+#        Function to benchmark engines on every tier         #
+#------------------------------------------------------------#
+#  - Takes engines, tiers, number of repeats, memory flag    #
+#    and ordering names as input                             #
+#  - Without orderings every engine runs with its default    #
+#    ordering, keyed by its name. Each ordering of an engine #
+#    is keyed "engine/ordering", the dlx engine has its own  #
+#    ordering and is only run with the default               #
+#  - Every repeat sweeps all engines and tiers, and the      #
+#    fastest time of every puzzle is kept                    #
+#  - Prints one line per engine and tier once timed          #
+#  - Returns dictionary of the run's environment and the     #
+#    metrics keyed by engine, then tier                      #
+#------------------------------------------------------------#
+
+
+def run_benchmarks(engine_names, tier_names, repeat=1, memory=True, ordering_names=None):
+    runs = []
+    for engine in engine_names:
+        if not ordering_names or engine == "dlx":
+            runs.append((engine, engine, None))
+        else:
+            runs.extend(("{}/{}".format(engine, name), engine, name) for name in ordering_names)
+
+    corpora = {tier: load_corpus(tier) for tier in tier_names}
+    latencies = {(key, tier): np.full(len(corpora[tier]), np.inf)
+                 for key, _, _ in runs for tier in tier_names}
+    solutions = {(key, tier): [None] * len(corpora[tier])
+                 for key, _, _ in runs for tier in tier_names}
+
+    # Sweeping every engine and tier per repeat spreads the
+    # repeats of a puzzle over the whole run, so a slow spell of
+    # the machine, which lasts seconds on shared hosts, costs it
+    # one repeat rather than all of them
+    for _ in range(repeat):
+        for key, engine, order in runs:
+            for tier in tier_names:
+                sweep_tier(corpora[tier], engine, latencies[key, tier],
+                           solutions[key, tier], order)
+
+    results = {}
+    for key, engine, order in runs:
+        results[key] = {}
+        for tier in tier_names:
+            metrics = run_tier(corpora[tier], engine, tiers[tier], latencies[key, tier],
+                               solutions[key, tier], memory, order)
+            results[key][tier] = metrics
+            print(format_metrics(key, tier, metrics), flush=True)
+
+    return {"environment": {"python": platform.python_version(),
+                            "numpy": np.__version__,
+                            "platform": platform.platform(),
+                            "processor": platform.processor(),
+                            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                            "repeat": repeat},
+            "results": results}
+
+#------------------------------------------------------------#
+#       Function to compare a run against the baseline       #
+#------------------------------------------------------------#
+#  - Takes run and baseline dictionaries and the relative    #
+#    tolerance as input                                      #
+#  - A metric regresses when it is worse than the baseline   #
+#    by more than the tolerance, errors regress on any       #
+#    increase. Engines and tiers missing from the baseline   #
+#    are skipped, as are percentiles of tiers with too few   #
+#    puzzles, which skipped_metrics lists                    #
+#  - Returns list of regression messages                     #
+#------------------------------------------------------------#
+
+
+def compare(run, baseline, tolerance=0.25):
+    regressions = []
+    for engine, engine_results in run["results"].items():
+        for tier, metrics in engine_results.items():
+            expected = baseline["results"].get(engine, {}).get(tier)
+            if expected is None:
+                continue
+
+            if metrics["errors"] > expected["errors"]:
+                regressions.append("{} {}: errors {} -> {}".format(
+                    engine, tier, expected["errors"], metrics["errors"]))
+
+            for metric, higher_is_better in compared_metrics.items():
+                old, new = expected.get(metric), metrics.get(metric)
+                if old is None or new is None:
+                    continue
+                if metrics["puzzles"] < percentile_samples.get(metric, 0):
+                    continue
+                if higher_is_better:
+                    worse = new < old / (1 + tolerance)
+                else:
+                    worse = new > old * (1 + tolerance)
+                if worse:
+                    regressions.append("{} {}: {} {:.3f} -> {:.3f} ({:+.0%})".format(
+                        engine, tier, metric, old, new, new / old - 1 if old else 0.0))
+
+    return regressions
+
+#------------------------------------------------------------#
+#     Function to list the percentiles left uncompared       #
+#------------------------------------------------------------#
+#  - Takes run dictionary as input                           #
+#  - Returns list of messages, one per engine, tier and      #
+#    percentile the tier has too few puzzles for             #
+#------------------------------------------------------------#
+
+
+def skipped_metrics(run):
+    skipped = []
+    for engine, engine_results in run["results"].items():
+        for tier, metrics in engine_results.items():
+            for metric, samples in percentile_samples.items():
+                if metrics["puzzles"] < samples:
+                    skipped.append("{} {}: {} needs {} puzzles, the tier has {}".format(
+                        engine, tier, metric, samples, metrics["puzzles"]))
+
+    return skipped
+
+#------------------------------------------------------------#
+#      Function to check the gate catches a slowdown         #
+#------------------------------------------------------------#
+#  - Takes baseline dictionary and the relative tolerance as #
+#    input                                                   #
+#  - Compares the baseline against a copy of itself with     #
+#    every latency multiplied and puzzles per second divided #
+#    by slowdown_factor                                      #
+#  - Returns list of "engine tier" names the slowdown is not #
+#    reported on                                             #
+#------------------------------------------------------------#
+
+
+def find_blind_spots(baseline, tolerance=0.25):
+    blind_spots = []
+    for engine, engine_results in baseline["results"].items():
+        for tier, metrics in engine_results.items():
+            slowed = dict(metrics)
+            for metric in compared_metrics:
+                if slowed.get(metric) is None:
+                    continue
+                if metric == "puzzles_per_second":
+                    slowed[metric] /= slowdown_factor
+                elif metric.endswith("_ms"):
+                    slowed[metric] *= slowdown_factor
+            run = {"results": {engine: {tier: slowed}}}
+            if not compare(run, baseline, tolerance):
+                blind_spots.append("{} {}".format(engine, tier))
+
+    return blind_spots
+
+#------------------------------------------------------------#
+#        Function to fold a run into the stored baseline     #
+#------------------------------------------------------------#
+#  - Takes run dictionary and baseline path as input         #
+#  - The engines and tiers of the run replace those of the   #
+#    baseline, the others are kept, so a slow engine can be  #
+#    recorded on its own                                     #
+#  - Returns the merged baseline dictionary                  #
+#------------------------------------------------------------#
+
+
+def merge_baseline(run, path):
+    if not os.path.exists(path):
+        return run
+
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file)
+    for engine, engine_results in run["results"].items():
+        baseline["results"].setdefault(engine, {}).update(engine_results)
+    baseline["environment"] = run["environment"]
+
+    return baseline
+
+
+def format_metrics(engine, tier, metrics):
+    memory = metrics["peak_memory_kb"]
+    return ("{:<10} {:<11} {:>4} puzzles {:>3} errors {:>10.1f}/s  p50 {:>9.3f}ms  "
+            "p95 {:>9.3f}ms  p99 {:>9.3f}ms  max {:>9.3f}ms  decisions {:>8.1f}  peak {}".format(
+                engine, tier, metrics["puzzles"], metrics["errors"],
+                metrics["puzzles_per_second"], metrics["p50_ms"], metrics["p95_ms"],
+                metrics["p99_ms"], metrics["max_ms"], metrics.get("mean_decisions", 0.0),
+                "-" if memory is None else "{:.0f}KiB".format(memory)))
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                    COMMAND LINE INTERFACE                  #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+
+def main(argv=None):
+    """
+    Benchmarks the engines on the bundled corpora and flags regressions
+    against the stored baseline.
+
+    Usage
+        python -m benchmarks.bench [--engines ...] [--tiers ...] [--repeat n] [--tolerance t]
+        python -m benchmarks.bench --save-baseline [--engines ...] [--tiers ...]
+        python -m benchmarks.bench --orderings mrv mrv-degree lcv --no-memory
+
+    Exits with 1 when a metric regressed past the tolerance, or when a 2x
+    slowdown of a baseline tier would not be reported.
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench",
+                                     description="Benchmark the Sudoku engines.")
+    parser.add_argument("--engines", nargs="+", default=default_engines, choices=engines)
+    parser.add_argument("--tiers", nargs="+", default=list(tiers), choices=list(tiers))
+    parser.add_argument("--orderings", nargs="+", choices=list(orderings),
+                        help="run the backtrack and bitmask engines once per named ordering")
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="solves per puzzle, the fastest is kept")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the traced pass that measures peak memory")
+    parser.add_argument("-o", "--output", default=default_output,
+                        help="JSON file the results are written to")
+    parser.add_argument("--baseline", default=default_baseline,
+                        help="JSON file of a previous run to compare against")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="merge the results into the baseline file instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="relative change allowed before a metric is a regression")
+    args = parser.parse_args(argv)
+
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    if not 0 <= args.tolerance < slowdown_factor - 1:
+        parser.error("--tolerance must be at least 0 and below {:g}".format(slowdown_factor - 1))
+
+    run = run_benchmarks(args.engines, args.tiers, args.repeat, not args.no_memory,
+                         args.orderings)
+
+    with open(args.output, "w") as output_file:
+        json.dump(run, output_file, indent=2)
+    print("results written to {}".format(args.output))
+
+    if args.save_baseline:
+        baseline = merge_baseline(run, args.baseline)
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2)
+        print("baseline written to {}".format(args.baseline))
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("no baseline at {}, nothing to compare".format(args.baseline))
+        return 0
+
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare(run, baseline, args.tolerance)
+    blind_spots = find_blind_spots(baseline, args.tolerance)
+
+    for skipped in skipped_metrics(run):
+        print("SKIPPED " + skipped)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    for blind_spot in blind_spots:
+        print("BLIND {}: a {:g}x slowdown would not be reported".format(blind_spot, slowdown_factor))
+    if regressions or blind_spots:
+        return 1
+
+    print("no regressions past {:.0%} against {}".format(args.tolerance, args.baseline))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
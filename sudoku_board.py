@@ -0,0 +1,163 @@
+import numpy as np
+
+from sudoku_io import (failure_nibble, format_board, gave_up_nibble, get_record_size, pack_boards,
+                       parse_line, unpack_boards)
+
+
+class Board:
+    """
+    Immutable 9x9 board packed into 41 bytes, hashable for deduplication
+    and caching.
+
+    The cells are stored as one packed record of sudoku_io, two 4-bit
+    cells per byte with the first cell in the high nibble, so blank cells
+    are 0, and the all -1 and all -2 results of sudoku_solver round-trip.
+    A board takes about 115 bytes of memory against 776 for a 9x9 int64
+    numpy array, and equal boards hash and compare equal.
+
+    Input
+        data : bytes-like
+            41 byte packed record, e.g. a record of a packed binary puzzle
+            file. Raises ValueError if a cell nibble is 10 to 13 or the
+            final padding nibble is not 0, so equal cells always mean
+            equal bytes.
+
+    Usage
+        board = Board.from_array(sudoku)
+        solution = sudoku_solver(board, engine="bitmask")    # a Board, board is unchanged
+        unique_boards = set(Board.from_arrays(puzzles))
+        array = np.asarray(solution)                         # 9x9 int8 array
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        data = bytes(data)
+        if len(data) != get_record_size(packed=True):
+            raise ValueError("expected {} bytes, got {}".format(get_record_size(packed=True),
+                                                                len(data)))
+        check_record(data)
+        object.__setattr__(self, "data", data)
+
+    @classmethod
+    def from_array(cls, board):
+        board = np.asarray(board)
+        if board.shape != (9, 9):
+            raise ValueError("Board only supports 9x9 boards, got shape {}".format(board.shape))
+        check_cell_values(board)
+        return cls(pack_boards(board[np.newaxis])[0].tobytes())
+
+    #--------------------------------------------------------#
+    #  Packs an (N, 9, 9) array at once, returns list of N   #
+    #  boards                                                #
+    #--------------------------------------------------------#
+    @classmethod
+    def from_arrays(cls, boards):
+        boards = np.asarray(boards)
+        if boards.shape[1:] != (9, 9):
+            raise ValueError("Board only supports 9x9 boards, got shape {}".format(boards.shape))
+        check_cell_values(boards)
+        records = pack_boards(boards).tobytes()
+        size = get_record_size(packed=True)
+        return [cls(records[i:i + size]) for i in range(0, len(records), size)]
+
+    @classmethod
+    def from_string(cls, line):
+        return cls.from_array(parse_line(line))
+
+    #--------------------------------------------------------#
+    #  Unpacks the cells into a new 9x9 int8 array           #
+    #--------------------------------------------------------#
+    def to_array(self):
+        return unpack_boards(np.frombuffer(self.data, dtype=np.uint8)[np.newaxis])[0]
+
+    #--------------------------------------------------------#
+    #  Returns a new array of the cells, numpy 2 passes copy #
+    #  - Raises ValueError for copy=False, the packed cells  #
+    #    cannot be viewed without unpacking them             #
+    #--------------------------------------------------------#
+    def __array__(self, dtype=None, copy=None):
+        if copy is False:
+            raise ValueError("a Board cannot be viewed as an array without a copy")
+        array = self.to_array()
+        return array if dtype is None else array.astype(dtype, copy=False)
+
+    #--------------------------------------------------------#
+    #  Returns the value of the cell at (row, column) from   #
+    #  its nibble, without unpacking the board               #
+    #--------------------------------------------------------#
+    def __getitem__(self, position):
+        row, column = position
+        if not (0 <= row < 9 and 0 <= column < 9):
+            raise IndexError("cell ({}, {}) is outside the board".format(row, column))
+
+        cell = 9*row + column
+        byte = self.data[cell // 2]
+        value = byte & 0xF if cell % 2 else byte >> 4
+        if value == failure_nibble:
+            return -1
+        if value == gave_up_nibble:
+            return -2
+        return value
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Board is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Board is immutable")
+
+    def __eq__(self, other):
+        if not isinstance(other, Board):
+            return NotImplemented
+        return self.data == other.data
+
+    def __hash__(self):
+        return hash(self.data)
+
+    def __reduce__(self):
+        return Board, (self.data,)
+
+    def __str__(self):
+        return format_board(self.to_array())
+
+    def __repr__(self):
+        return "Board({!r})".format(self.data)
+
+# Bytes whose two nibbles are cells, 0 to 9, gave_up_nibble or
+# failure_nibble, and the valid last bytes of a record, whose
+# low nibble is padding and must be 0
+cell_nibbles = set(range(10)) | {gave_up_nibble, failure_nibble}
+record_bytes = bytes(high << 4 | low for high in cell_nibbles for low in cell_nibbles)
+last_bytes = bytes(high << 4 for high in cell_nibbles)
+
+#------------------------------------------------------------#
+#          Function to check the nibbles of a record         #
+#------------------------------------------------------------#
+#  - Takes 41 byte packed record as input                    #
+#  - Raises ValueError if a cell nibble is not 0 to 9,       #
+#    gave_up_nibble or failure_nibble, or the padding nibble #
+#    after the last cell is not 0                            #
+#------------------------------------------------------------#
+
+
+def check_record(data):
+    if data[-1] & 0xF:
+        raise ValueError("padding nibble must be 0, got {}".format(data[-1] & 0xF))
+
+    # Deleting the valid bytes leaves the invalid ones
+    invalid = data[:-1].translate(None, record_bytes) + data[-1:].translate(None, last_bytes)
+    if invalid:
+        raise ValueError("invalid cell nibbles in byte 0x{:02X}".format(invalid[0]))
+
+#------------------------------------------------------------#
+#      Function to check that cells fit in a 4-bit nibble    #
+#------------------------------------------------------------#
+#  - Takes array of boards as input                          #
+#  - Raises ValueError if a cell is not -2 (gave up), -1     #
+#    (failure), 0 (blank) or a value 1 to 9                  #
+#------------------------------------------------------------#
+
+
+def check_cell_values(boards):
+    if boards.size and (boards.min() < -2 or boards.max() > 9):
+        raise ValueError("cell values must be -2 to 9")
@@ -0,0 +1,289 @@
+import os
+from collections import OrderedDict, namedtuple
+from itertools import groupby, permutations, product
+
+import numpy as np
+
+from sudoku_solver import gave_up, solve_board
+
+# Validity-preserving transformation of a board: optional
+# transposition, then row and column permutations that keep
+# bands and stacks together, then digit relabelling
+# (digits[value] is the new value, digits[0] is 0)
+Transform = namedtuple("Transform", ["transpose", "rows", "columns", "digits"])
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "evictions", "maxsize", "currsize"])
+
+
+class SolutionCache:
+    """
+    Bounded LRU cache of solutions placed in front of sudoku_solver.
+
+    Puzzles are stored under their canonical form, so repeated puzzles and
+    their relabelled, permuted or transposed variants share one entry. On a
+    hit the stored canonical solution is transformed back to the caller's
+    orientation. Puzzles seen before are first looked up by their exact
+    cells, so a repeated puzzle skips the canonical form.
+
+    Input
+        maxsize : int
+            Number of canonical puzzles kept, the least recently used entry
+            is evicted first.
+        path : str or None
+            File the cache is loaded from, if it exists, and saved to by
+            save().
+
+    Usage
+        cache = SolutionCache(maxsize=10000, path="solutions.npz")
+        solution = sudoku_solver(sudoku, cache=cache)
+        cache.save()
+    """
+
+    def __init__(self, maxsize=1024, path=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict()
+        self.exact = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    #--------------------------------------------------------#
+    #  Returns the solution of a board, solving its          #
+    #  canonical form on a miss                              #
+    #  - The board is not modified                           #
+    #  - The exact cells of a board are mapped to its        #
+    #    canonical key and transform, so the canonical form  #
+    #    is only computed for boards not seen before         #
+    #  - limits, stats and order are those of the calling    #
+    #    sudoku_solver and only apply to the search of a     #
+    #    miss, a search that gives up is not stored          #
+    #  - Returns 9x9 solution, all -1 if there is none and   #
+    #    all -2 if the search gave up                        #
+    #--------------------------------------------------------#
+    def solve(self, board, engine="backtrack", limits=None, stats=None, order=None):
+        if np.shape(board) != (9, 9):
+            raise ValueError("the solution cache only supports 9x9 boards")
+        cells = np.asarray(board).astype(np.int8).tobytes()
+
+        # Boards are validated before they reach the cache, so
+        # their int8 bytes are exact
+        if cells in self.exact:
+            key, transform = self.exact[cells]
+            if key in self.entries:
+                self.exact.move_to_end(cells)
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.restore(self.entries[key], transform)
+            del self.exact[cells]
+
+        key, canonical, transform = canonical_form(board)
+
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            solution = self.entries[key]
+        else:
+            self.misses += 1
+            solution = solve_board(canonical.copy(), engine, stats=stats, limits=limits,
+                                   order=order)
+            if solution[0, 0] == gave_up:
+                return solution
+            solution = None if solution[0, 0] == -1 else solution.astype(np.int8)
+            self.store(key, solution)
+
+        self.exact[cells] = (key, transform)
+        while len(self.exact) > self.maxsize:
+            self.exact.popitem(last=False)
+
+        return self.restore(solution, transform)
+
+    @staticmethod
+    def restore(solution, transform):
+        if solution is None:
+            return np.full((9, 9), -1, dtype=int)
+        return invert_transform(solution, transform)
+
+    #--------------------------------------------------------#
+    #  Adds a canonical solution and evicts the least        #
+    #  recently used entries beyond maxsize                  #
+    #--------------------------------------------------------#
+    def store(self, key, solution):
+        self.entries[key] = solution
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self.entries))
+
+    def clear(self):
+        self.entries.clear()
+        self.exact.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    #--------------------------------------------------------#
+    #  Writes the entries, oldest first, to an npz file of   #
+    #  (M, 81) int8 keys and solutions, all -1 solutions for #
+    #  puzzles without one                                   #
+    #--------------------------------------------------------#
+    def save(self, path=None):
+        path = path or self.path
+        if path is None:
+            raise ValueError("no path given to save the cache to")
+
+        keys = np.zeros((len(self.entries), 81), dtype=np.int8)
+        solutions = np.full((len(self.entries), 81), -1, dtype=np.int8)
+        for i, (key, solution) in enumerate(self.entries.items()):
+            keys[i] = np.frombuffer(key, dtype=np.int8)
+            if solution is not None:
+                solutions[i] = solution.ravel()
+
+        with open(path, "wb") as cache_file:
+            np.savez_compressed(cache_file, keys=keys, solutions=solutions)
+
+    #--------------------------------------------------------#
+    #  Adds the entries of a file written by save, keeping   #
+    #  the most recent maxsize entries                       #
+    #--------------------------------------------------------#
+    def load(self, path):
+        with np.load(path) as data:
+            for key, solution in zip(data["keys"], data["solutions"]):
+                solution = None if solution[0] == -1 else solution.reshape(9, 9)
+                self.entries[key.tobytes()] = solution
+                self.entries.move_to_end(key.tobytes())
+
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                 CANONICAL FORM FUNCTIONS                   #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+# Most orderings of tied lines tried per orientation
+tie_limit = 64
+
+#------------------------------------------------------------#
+#          Function to get a board's canonical form          #
+#------------------------------------------------------------#
+#  - Takes 9x9 board as input                                #
+#  - Bands, rows, stacks and columns are ordered by digit    #
+#    independent keys, digits are relabelled in order of     #
+#    first appearance, and the smallest board over both      #
+#    orientations and the orderings of tied lines is kept    #
+#  - Past tie_limit orderings only the first is tried, so a  #
+#    few highly symmetric variants get different forms, but  #
+#    every form maps back exactly through its transform      #
+#  - Returns the bytes key, the 9x9 canonical board and the  #
+#    Transform from the board to it                          #
+#------------------------------------------------------------#
+
+
+def canonical_form(board):
+    board = np.asarray(board)
+    best = None
+
+    for transpose in (False, True):
+        oriented = board.T if transpose else board
+        filled = oriented != 0
+        row_orders = get_line_orders(filled)
+        column_orders = get_line_orders(filled.T)
+        if len(row_orders) * len(column_orders) > tie_limit:
+            row_orders, column_orders = row_orders[:1], column_orders[:1]
+
+        for rows, columns in product(row_orders, column_orders):
+            geometric = oriented[rows][:, columns]
+            digits = get_digit_order(geometric)
+
+            canonical = digits[geometric]
+            key = canonical.astype(np.int8).tobytes()
+            if best is None or key < best[0]:
+                best = (key, canonical, Transform(transpose, rows, columns, digits))
+
+    return best
+
+#------------------------------------------------------------#
+#        Function to get the orderings of a board's lines    #
+#------------------------------------------------------------#
+#  - Takes 9x9 boolean array of filled cells as input        #
+#  - Every row is keyed by its number of givens and the      #
+#    numbers of givens in the columns it fills, bands by the #
+#    sorted keys of their rows                               #
+#  - Orders the bands by key, then the rows inside each      #
+#    band, so rows never leave their band                    #
+#  - Returns list of every ordering of the 9 row indices     #
+#    that only differs in the order of equal keys            #
+#------------------------------------------------------------#
+
+
+def get_line_orders(filled):
+    # The column counts of empty cells sort first as -1, so rows
+    # with equal numbers of givens compare as their filled cells
+    column_counts = np.where(filled, filled.sum(axis=0), -1)
+    column_counts.sort(axis=1)
+    keys = list(zip(filled.sum(axis=1).tolist(), map(tuple, column_counts.tolist())))
+    band_keys = [sorted(keys[3*band:3*band + 3]) for band in range(3)]
+
+    band_orders = get_tied_orders(range(3), band_keys)
+    row_orders = [get_tied_orders(range(3*band, 3*band + 3), keys) for band in range(3)]
+
+    return [np.array([row for band_rows in rows for row in band_rows])
+            for bands in band_orders
+            for rows in product(*[row_orders[band] for band in bands])]
+
+#------------------------------------------------------------#
+#        Function to order items with tied keys              #
+#------------------------------------------------------------#
+#  - Takes items and list of keys indexed by item as input   #
+#  - Returns list of item orderings sorted by key, one for   #
+#    every permutation of the items with equal keys          #
+#------------------------------------------------------------#
+
+
+def get_tied_orders(items, keys):
+    items = sorted(items, key=lambda item: keys[item])
+    groups = [list(group) for _, group in groupby(items, key=lambda item: keys[item])]
+
+    return [[item for group in ordering for item in group]
+            for ordering in product(*[permutations(group) for group in groups])]
+
+#------------------------------------------------------------#
+#        Function to relabel digits by first appearance      #
+#------------------------------------------------------------#
+#  - Takes 9x9 board as input                                #
+#  - Returns array mapping every value 0-9 to its new label, #
+#    digits missing from the board take the labels left      #
+#------------------------------------------------------------#
+
+
+def get_digit_order(board):
+    order = list(dict.fromkeys(board[board > 0].tolist()))
+    order += [value for value in range(1, 10) if value not in order]
+
+    digits = np.zeros(10, dtype=int)
+    digits[order] = np.arange(1, 10)
+    return digits
+
+#------------------------------------------------------------#
+#     Function to map a canonical board back to a board      #
+#------------------------------------------------------------#
+#  - Takes 9x9 canonical board and Transform as input        #
+#  - Returns 9x9 board in the original orientation           #
+#------------------------------------------------------------#
+
+
+def invert_transform(canonical, transform):
+    labels = np.zeros(10, dtype=int)
+    labels[transform.digits] = np.arange(10)
+
+    oriented = np.empty((9, 9), dtype=int)
+    oriented[np.ix_(transform.rows, transform.columns)] = labels[canonical]
+
+    return oriented.T.copy() if transform.transpose else oriented
@@ -0,0 +1,393 @@
+import argparse
+import os
+import sys
+import time
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from math import isqrt
+
+import numpy as np
+
+from sudoku_io import format_board
+from sudoku_solver import (SearchState, SearchStats, backtrack_bitmask, count_bitmask,
+                           get_geometry)
+
+# A generated puzzle with its unique solution, its grade and the
+# number of search decisions the grade was taken from
+GeneratedPuzzle = namedtuple("GeneratedPuzzle", ["puzzle", "solution", "grade", "decisions"])
+
+# Grades from easiest to hardest:
+#  - easy: solved by naked and hidden singles
+#  - medium: also needs naked pairs and pointing pairs
+#  - hard: needs search, at most hard_decisions decisions
+#  - expert: needs more decisions than that
+grade_names = ("easy", "medium", "hard", "expert")
+hard_decisions = 4
+
+
+def generate_puzzle(rng=None, box_size=3, symmetric=True):
+    """
+    Generates a random Sudoku puzzle with a unique solution and grades it.
+
+    Input
+        rng : numpy.random.Generator, int or None
+            Source of randomness, or seed of a new numpy Generator.
+        box_size : int
+            n of the n^2 x n^2 board, 3 for 9x9.
+        symmetric : bool
+            Removes clues in pairs of cells mirrored through the centre,
+            so the givens have 180 degree rotational symmetry.
+
+    Output
+        GeneratedPuzzle
+            The puzzle, its solution, its grade (one of grade_names) and the
+            number of search decisions it needed.
+    """
+    rng = np.random.default_rng(rng)
+
+    solution = random_grid(rng, box_size)
+    puzzle = remove_clues(solution, rng, symmetric)
+    grade, decisions = grade_puzzle(puzzle)
+
+    return GeneratedPuzzle(puzzle, solution, grade, decisions)
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                    COMPLETE GRID FUNCTIONS                 #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+#------------------------------------------------------------#
+#          Function to generate a random complete grid       #
+#------------------------------------------------------------#
+#  - Takes numpy Generator and box size as input             #
+#  - The boxes on the diagonal share no unit, so each one is #
+#    filled with an independent random permutation and the   #
+#    rest of the grid is completed by the bitmask search     #
+#  - The search always tries the lowest value first, so the  #
+#    grid is then shuffled by a random validity-preserving   #
+#    transformation to spread its values and positions       #
+#  - Returns n^2 x n^2 int array                             #
+#------------------------------------------------------------#
+
+
+def random_grid(rng, box_size=3):
+    size = box_size * box_size
+
+    while True:
+        board = np.zeros((size, size), dtype=int)
+        for box in range(box_size):
+            start = box * box_size
+            board[start:start + box_size, start:start + box_size] = (
+                rng.permutation(size).reshape(box_size, box_size) + 1)
+
+        state = SearchState(board)
+        if state.propagate() and backtrack_bitmask(state):
+            return shuffle_grid(np.reshape(state.values, (size, size)), rng)
+
+#------------------------------------------------------------#
+#        Function to randomly transform a complete grid      #
+#------------------------------------------------------------#
+#  - Takes n^2 x n^2 grid and numpy Generator as input       #
+#  - Relabels the values, permutes the bands, the rows in    #
+#    every band, the stacks and the columns in every stack,  #
+#    and transposes with probability one half                #
+#  - Returns the transformed grid, which is valid if the     #
+#    input is                                                #
+#------------------------------------------------------------#
+
+
+def shuffle_grid(grid, rng):
+    size = len(grid)
+    box_size = isqrt(size)
+
+    labels = np.concatenate(([0], rng.permutation(size) + 1))
+    rows = get_line_permutation(rng, box_size)
+    columns = get_line_permutation(rng, box_size)
+
+    grid = labels[grid][np.ix_(rows, columns)]
+    return grid.T.copy() if rng.random() < 0.5 else grid
+
+
+def get_line_permutation(rng, box_size):
+    return np.concatenate([box_size * band + rng.permutation(box_size)
+                           for band in rng.permutation(box_size)])
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                  CLUE REMOVAL FUNCTIONS                    #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+#------------------------------------------------------------#
+#         Function to remove clues from a complete grid      #
+#------------------------------------------------------------#
+#  - Takes complete grid, numpy Generator and symmetry flag  #
+#    as input                                                #
+#  - Visits the cells in random order and removes each one   #
+#    (with its mirrored cell when symmetric) if the puzzle   #
+#    stays unique, otherwise the clue is kept for good:      #
+#    removing more clues only adds solutions, so a clue that #
+#    is needed once is needed in every later puzzle          #
+#  - Uniqueness is checked incrementally against the known   #
+#    solution: any new solution has to differ from it in one #
+#    of the cells just removed, so only those are searched   #
+#  - Returns puzzle with 0 for blank cells, a minimal puzzle #
+#    for the visiting order                                  #
+#------------------------------------------------------------#
+
+
+def remove_clues(solution, rng, symmetric=True):
+    puzzle = np.array(solution, dtype=int)
+    flat = puzzle.reshape(-1)
+    cells = flat.size
+
+    for cell in rng.permutation(cells):
+        if not flat[cell]:
+            continue
+        removed = {cell, cells - 1 - cell} if symmetric else {cell}
+
+        flat[list(removed)] = 0
+        if any(has_other_value(puzzle, other, int(solution.flat[other])) for other in removed):
+            flat[list(removed)] = solution.flat[list(removed)]
+
+    return puzzle
+
+#------------------------------------------------------------#
+#   Function to check for a solution with another value in   #
+#   a cell                                                   #
+#------------------------------------------------------------#
+#  - Takes puzzle, cell index and value as input             #
+#  - While many clues are left the cell is usually a single  #
+#    of the givens, which needs no search                    #
+#  - Otherwise removes value from the cell's candidates and  #
+#    searches for any solution of what is left               #
+#  - Returns True if the puzzle has a solution that does not #
+#    hold value in cell                                      #
+#------------------------------------------------------------#
+
+
+def has_other_value(puzzle, cell, value):
+    if is_given_single(puzzle, cell, value):
+        return False
+
+    state = SearchState(puzzle)
+    if not (state.eliminate(cell, 1 << (value - 1)) and state.propagate()):
+        return False
+
+    return count_bitmask(state, 1) > 0
+
+#------------------------------------------------------------#
+#   Function to check whether the givens force a value       #
+#------------------------------------------------------------#
+#  - Takes puzzle, blank cell index and value as input       #
+#  - Returns True if value is a naked single of the cell     #
+#    (its peers hold every other value) or a hidden single   #
+#    (no other cell of one of its units can hold it)         #
+#------------------------------------------------------------#
+
+
+def is_given_single(puzzle, cell, value):
+    geometry = get_geometry(isqrt(len(puzzle)))
+    flat = puzzle.reshape(-1)
+
+    peer_values = set(flat[geometry.peer_array[cell]].tolist())
+    if len(peer_values - {0}) == geometry.size - 1:
+        return True
+
+    # Cells that are filled or see value among their peers
+    blocked = flat != 0
+    blocked[geometry.peer_array[flat == value]] = True
+    for unit in geometry.cell_units[cell]:
+        if np.count_nonzero(blocked[geometry.unit_array[unit]]) == geometry.size - 1:
+            return True
+
+    return False
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                      GRADING FUNCTIONS                     #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+#------------------------------------------------------------#
+#           Function to grade a puzzle's difficulty          #
+#------------------------------------------------------------#
+#  - Takes puzzle with a unique solution as input            #
+#  - Tries the techniques in order of difficulty: singles,   #
+#    then pairs, then the bitmask search with pairs, whose   #
+#    decisions split hard from expert                        #
+#  - Returns grade name and number of search decisions       #
+#------------------------------------------------------------#
+
+
+def grade_puzzle(puzzle):
+    state = SearchState(puzzle)
+    if not state.propagate():
+        raise ValueError("puzzle has no solution")
+    if 0 not in state.values:
+        return "easy", 0
+
+    if not state.propagate(pairs=True):
+        raise ValueError("puzzle has no solution")
+    if 0 not in state.values:
+        return "medium", 0
+
+    stats = SearchStats()
+    if not backtrack_bitmask(state, pairs=True, stats=stats):
+        raise ValueError("puzzle has no solution")
+
+    return "hard" if stats.decisions <= hard_decisions else "expert", stats.decisions
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                   BATCH GENERATION FUNCTIONS               #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+
+def generate_puzzles(count, seed=None, grades=None, workers=1, chunksize=16, box_size=3,
+                     symmetric=True):
+    """
+    Lazily generates graded puzzles, optionally on a process pool.
+
+    Input
+        count : int
+            Number of puzzles to generate.
+        seed : int or None
+            Seed of the run. With a seed the same puzzles are generated in
+            the same order for any number of workers.
+        grades : collection of str or None
+            Grades to keep, puzzles of other grades are discarded. None
+            keeps every grade.
+        workers : int or None
+            Number of processes, None uses os.cpu_count(). With 1 the
+            puzzles are generated in the calling process.
+        chunksize : int
+            Number of puzzles generated per task.
+        box_size, symmetric
+            Passed on to generate_puzzle.
+
+    Output
+        iterator of GeneratedPuzzle
+            count puzzles, yielded as their chunks finish.
+    """
+    if grades is not None:
+        unknown = set(grades) - set(grade_names)
+        if unknown:
+            raise ValueError("Unknown grades: {}".format(", ".join(sorted(unknown))))
+        grades = tuple(grades)
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
+
+    # One independent random stream per chunk, spawned from the run's seed
+    starts = range(0, count, chunksize)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    chunks = [(chunk_seed, min(chunksize, count - start), grades, box_size, symmetric)
+              for chunk_seed, start in zip(seeds, starts)]
+
+    if workers == 1:
+        for chunk in chunks:
+            yield from generate_chunk(*chunk)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # At most two chunks per worker are pending, so memory stays flat
+        # however many puzzles are asked for
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(generate_chunk, *chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+#------------------------------------------------------------#
+#         Function to generate one chunk of puzzles          #
+#------------------------------------------------------------#
+#  - Takes SeedSequence, number of puzzles, grades to keep,  #
+#    box size and symmetry flag as input                     #
+#  - Returns list of GeneratedPuzzle                         #
+#------------------------------------------------------------#
+
+
+def generate_chunk(seed, count, grades=None, box_size=3, symmetric=True):
+    rng = np.random.default_rng(seed)
+    puzzles = []
+    while len(puzzles) < count:
+        generated = generate_puzzle(rng, box_size, symmetric)
+        if grades is None or generated.grade in grades:
+            puzzles.append(generated)
+
+    return puzzles
+
+#------------------------------------------------------------#
+#        Function to stream generated puzzles to a file      #
+#------------------------------------------------------------#
+#  - Takes output path ("-" for stdout), number of puzzles   #
+#    and the generate_puzzles arguments as input             #
+#  - Writes a "#" header, then one 81 character line per     #
+#    puzzle as it is generated, in the format read by        #
+#    sudoku_io.read_puzzles                                  #
+#  - Returns Counter of the grades written                   #
+#------------------------------------------------------------#
+
+
+def generate_file(output_path, count, seed=None, grades=None, workers=1, chunksize=16,
+                  symmetric=True):
+    output_file = sys.stdout if output_path == "-" else open(output_path, "w")
+    written = Counter()
+    try:
+        output_file.write("# {} puzzles, seed {}, grades {}\n".format(
+            count, seed, " ".join(grades) if grades else "all"))
+        for generated in generate_puzzles(count, seed, grades, workers, chunksize,
+                                          symmetric=symmetric):
+            output_file.write(format_board(generated.puzzle) + "\n")
+            written[generated.grade] += 1
+    finally:
+        if output_file is not sys.stdout:
+            output_file.close()
+
+    return written
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                    COMMAND LINE INTERFACE                  #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+
+def main(argv=None):
+    """
+    Generates graded 9x9 puzzles with unique solutions.
+
+    Usage
+        python -m sudoku_generator -n 1000 -o puzzles.txt [--seed 1] [--grades hard expert] [-w 4]
+
+    Prints the number of puzzles per grade and the throughput to stderr.
+    """
+    parser = argparse.ArgumentParser(prog="python -m sudoku_generator",
+                                     description="Generate graded Sudoku puzzles.")
+    parser.add_argument("-n", "--count", type=int, default=1)
+    parser.add_argument("-o", "--output", default="-")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--grades", nargs="+", choices=grade_names,
+                        help="grades to keep, every grade by default")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of processes, 0 uses every CPU")
+    parser.add_argument("--chunksize", type=int, default=16)
+    parser.add_argument("--no-symmetry", action="store_true",
+                        help="remove clues one cell at a time instead of in mirrored pairs")
+    args = parser.parse_args(argv)
+
+    if args.count < 0:
+        parser.error("--count must not be negative")
+
+    start = time.perf_counter()
+    try:
+        written = generate_file(args.output, args.count, args.seed, args.grades,
+                                args.workers or None, args.chunksize, not args.no_symmetry)
+    except (OSError, ValueError) as error:
+        print("error: {}".format(error), file=sys.stderr)
+        return 2
+    elapsed = time.perf_counter() - start
+
+    print("{} puzzles ({}) in {:.2f}s ({:.1f} puzzles/s)".format(
+        args.count, ", ".join("{} {}".format(written[grade], grade) for grade in grade_names),
+        elapsed, args.count / elapsed if elapsed else 0.0), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+import argparse
+import sys
+
+import numpy as np
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                  TEXT FORMAT FUNCTIONS                     #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+# One puzzle per line as 81 characters read row by row, with
+# "0" or "." for blank cells. Unsolvable puzzles are written
+# as a line of 81 "-" characters, and puzzles the search gave
+# up on (all -2) as a line of 81 "?" characters.
+blank_characters = "0."
+failure_character = "-"
+gave_up_character = "?"
+
+#------------------------------------------------------------#
+#           Function to parse one 81 character line          #
+#------------------------------------------------------------#
+#  - Takes a line of text as input                           #
+#  - Returns 9x9 numpy array with 0 for blank cells          #
+#  - Raises ValueError if the line is not 81 cells           #
+#------------------------------------------------------------#
+
+
+def parse_line(line):
+    line = line.strip()
+    if len(line) != 81:
+        raise ValueError("expected 81 cells, got {}".format(len(line)))
+
+    board = np.zeros(81, dtype=int)
+    for i, character in enumerate(line):
+        if character in blank_characters:
+            continue
+        if not "1" <= character <= "9":
+            raise ValueError("invalid cell {!r}".format(character))
+        board[i] = ord(character) - ord("0")
+
+    return board.reshape(9, 9)
+
+#------------------------------------------------------------#
+#           Function to format a board as one line           #
+#------------------------------------------------------------#
+#  - Takes 9x9 board as input                                #
+#  - Returns 81 character string, "-" * 81 if the board is   #
+#    the all -1 failure and "?" * 81 if it is all -2         #
+#------------------------------------------------------------#
+
+
+def format_board(board):
+    board = np.asarray(board)
+    if np.all(board == -1):
+        return failure_character * 81
+    if np.all(board == -2):
+        return gave_up_character * 81
+
+    return "".join(str(value) for value in board.ravel())
+
+#------------------------------------------------------------#
+#         Function to lazily read puzzles from a file        #
+#------------------------------------------------------------#
+#  - Takes an iterable of lines (open file or stdin) as      #
+#    input                                                   #
+#  - Yields one 9x9 board per non-empty line, skipping lines #
+#    starting with "#"                                       #
+#  - Raises ValueError with the line number of a malformed   #
+#    line                                                    #
+#------------------------------------------------------------#
+
+
+def read_puzzles(lines):
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            yield parse_line(line)
+        except ValueError as error:
+            raise ValueError("line {}: {}".format(line_number, error)) from None
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                 BINARY FORMAT FUNCTIONS                    #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+# A binary puzzle file is a 16 byte header followed by one
+# fixed size record per board:
+#  - unpacked records are 81 int8 cells, so the file opens
+#    with np.memmap as an (N, 9, 9) array of zero-copy boards
+#  - packed records are 41 bytes of 4-bit cells, two per byte
+#    with the first cell in the high nibble, the last nibble
+#    is padding
+# Blank cells are 0, unsolvable boards are all -1 (0xF in a
+# packed record) and boards the search gave up on are all -2
+# (0xE in a packed record).
+header_dtype = np.dtype([("magic", "S4"), ("version", "u1"), ("packed", "u1"),
+                         ("reserved", "<u2"), ("count", "<u8")])
+binary_magic = b"SDKU"
+binary_version = 1
+failure_nibble = 0xF
+gave_up_nibble = 0xE
+
+#------------------------------------------------------------#
+#         Function to create an empty binary puzzle file     #
+#------------------------------------------------------------#
+#  - Takes path, number of boards and packed flag as input   #
+#  - Returns writable memmap of the records                  #
+#------------------------------------------------------------#
+
+
+def create_puzzle_file(path, count, packed=False):
+    header = np.zeros(1, dtype=header_dtype)
+    header["magic"] = binary_magic
+    header["version"] = binary_version
+    header["packed"] = packed
+    header["count"] = count
+
+    with open(path, "wb") as binary_file:
+        binary_file.write(header.tobytes())
+        binary_file.truncate(header_dtype.itemsize + count * get_record_size(packed))
+
+    return open_puzzle_file(path, mode="r+")[0]
+
+#------------------------------------------------------------#
+#           Function to open a binary puzzle file            #
+#------------------------------------------------------------#
+#  - Takes path and np.memmap mode as input                  #
+#  - Returns memmap of the records and packed flag, the      #
+#    records are (N, 9, 9) int8 boards or (N, 41) uint8      #
+#    packed records                                          #
+#  - Raises ValueError if the file is not a puzzle file      #
+#------------------------------------------------------------#
+
+
+def open_puzzle_file(path, mode="r"):
+    header = np.fromfile(path, dtype=header_dtype, count=1)
+    if len(header) != 1 or header["magic"][0] != binary_magic:
+        raise ValueError("{} is not a binary puzzle file".format(path))
+    if header["version"][0] != binary_version:
+        raise ValueError("unsupported binary puzzle file version {}".format(header["version"][0]))
+
+    packed = bool(header["packed"][0])
+    count = int(header["count"][0])
+    if packed:
+        dtype, shape = np.uint8, (count, get_record_size(packed))
+    else:
+        dtype, shape = np.int8, (count, 9, 9)
+
+    # An empty file cannot be mapped, a zero-length memmap view
+    # keeps the interface, its flush does nothing
+    if count == 0:
+        return np.empty(shape, dtype=dtype).view(np.memmap), packed
+
+    return np.memmap(path, dtype=dtype, mode=mode, offset=header_dtype.itemsize, shape=shape), packed
+
+#------------------------------------------------------------#
+#            Function to get the size of a record            #
+#------------------------------------------------------------#
+#  - Takes packed flag as input                              #
+#  - Returns number of bytes per board                       #
+#------------------------------------------------------------#
+
+
+def get_record_size(packed):
+    return 41 if packed else 81
+
+#------------------------------------------------------------#
+#           Function to pack boards into 4-bit cells         #
+#------------------------------------------------------------#
+#  - Takes (N, 9, 9) boards as input                         #
+#  - Returns (N, 41) uint8 packed records                    #
+#------------------------------------------------------------#
+
+
+def pack_boards(boards):
+    cells = np.zeros((len(boards), 82), dtype=np.uint8)
+    boards = np.where(boards == -1, failure_nibble, boards)
+    cells[:, :81] = np.where(boards == -2, gave_up_nibble, boards).reshape(-1, 81)
+
+    return (cells[:, 0::2] << 4) | cells[:, 1::2]
+
+#------------------------------------------------------------#
+#          Function to unpack 4-bit cells into boards        #
+#------------------------------------------------------------#
+#  - Takes (N, 41) uint8 packed records as input             #
+#  - Returns (N, 9, 9) int8 boards                           #
+#------------------------------------------------------------#
+
+
+def unpack_boards(records):
+    cells = np.empty((len(records), 82), dtype=np.int8)
+    cells[:, 0::2] = records >> 4
+    cells[:, 1::2] = records & 0xF
+    cells[cells == failure_nibble] = -1
+    cells[cells == gave_up_nibble] = -2
+
+    return cells[:, :81].reshape(-1, 9, 9)
+
+#------------------------------------------------------------#
+#        Function to convert a text file to binary           #
+#------------------------------------------------------------#
+#  - Takes text path, binary path and packed flag as input   #
+#  - Streams the text file, so memory stays flat             #
+#  - Returns number of boards written                        #
+#------------------------------------------------------------#
+
+
+def text_to_binary(text_path, binary_path, packed=False):
+    header = np.zeros(1, dtype=header_dtype)
+    header["magic"] = binary_magic
+    header["version"] = binary_version
+    header["packed"] = packed
+
+    count = 0
+    with open(text_path) as text_file, open(binary_path, "wb") as binary_file:
+        binary_file.write(header.tobytes())
+        for board in read_puzzles(text_file):
+            board = board.astype(np.int8).reshape(1, 9, 9)
+            binary_file.write((pack_boards(board) if packed else board).tobytes())
+            count += 1
+
+        # Rewriting the header once the number of boards is known
+        header["count"] = count
+        binary_file.seek(0)
+        binary_file.write(header.tobytes())
+
+    return count
+
+#------------------------------------------------------------#
+#        Function to convert a binary file to text           #
+#------------------------------------------------------------#
+#  - Takes binary path and text path as input                #
+#  - Returns number of boards written                        #
+#------------------------------------------------------------#
+
+
+def binary_to_text(binary_path, text_path):
+    records, packed = open_puzzle_file(binary_path)
+
+    with open(text_path, "w") as text_file:
+        for record in records:
+            board = unpack_boards(record[np.newaxis])[0] if packed else record
+            text_file.write(format_board(board) + "\n")
+
+    return len(records)
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                    COMMAND LINE INTERFACE                  #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+
+def main(argv=None):
+    """
+    Converts between the 81 character text format and the binary format.
+
+    Usage
+        python -m sudoku_io to-binary puzzles.txt puzzles.sdk [--packed]
+        python -m sudoku_io to-text solutions.sdk solutions.txt
+    """
+    parser = argparse.ArgumentParser(prog="python -m sudoku_io",
+                                     description="Convert Sudoku puzzle files.")
+    parser.add_argument("command", choices=["to-binary", "to-text"])
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    parser.add_argument("--packed", action="store_true",
+                        help="write 4-bit cells instead of one byte per cell")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "to-binary":
+            count = text_to_binary(args.source, args.destination, packed=args.packed)
+        else:
+            count = binary_to_text(args.source, args.destination)
+    except (OSError, ValueError) as error:
+        print("error: {}".format(error), file=sys.stderr)
+        return 2
+
+    print("{} boards written to {}".format(count, args.destination), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,381 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from sudoku_io import format_board, parse_line
+from sudoku_solver import engines, gave_up, sudoku_solver
+
+
+class SolverService:
+    """
+    Asyncio front end of sudoku_solver backed by a bounded process pool.
+
+    Puzzles are solved on the pool, so awaiting a solve never blocks the
+    event loop. Identical puzzles in flight at the same time share one
+    solve. At most max_pending distinct puzzles are queued or solving,
+    further callers wait in solve() until one finishes.
+
+    Input
+        workers : int or None
+            Number of pool processes, defaults to os.cpu_count().
+        max_pending : int or None
+            Number of distinct puzzles queued or solving at once, defaults
+            to four per worker.
+        engine : str
+            Engine passed on to sudoku_solver.
+        timeout, max_nodes : float, int or None
+            Limits of every solve, passed on to sudoku_solver.
+
+    Usage
+        async with SolverService(workers=4) as service:
+            solution = await service.solve(sudoku)
+            print(service.metrics())
+    """
+
+    # Number of most recent request latencies the percentiles
+    # of metrics() are taken over
+    latency_window = 1024
+
+    def __init__(self, workers=None, max_pending=None, engine="bitmask", timeout=None,
+                 max_nodes=None):
+        if engine not in engines:
+            raise ValueError("Unknown engine: {}".format(engine))
+        if workers is not None and workers < 1:
+            raise ValueError("workers must be at least 1")
+        if max_pending is not None and max_pending < 1:
+            raise ValueError("max_pending must be at least 1")
+
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 4 * self.workers
+        self.solve_function = partial(sudoku_solver, engine=engine, timeout=timeout,
+                                      max_nodes=max_nodes)
+        self.executor = ProcessPoolExecutor(self.workers)
+        self.slots = asyncio.Semaphore(self.max_pending)
+        self.in_flight = {}
+        self.latencies = deque(maxlen=self.latency_window)
+
+        self.waiting = 0
+        self.requests = 0
+        self.coalesced = 0
+        self.solved = 0
+        self.failed = 0
+        self.given_up = 0
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    #--------------------------------------------------------#
+    #  Starts the pool processes ahead of the first solve    #
+    #  - Forked workers inherit the open file descriptors,   #
+    #    so a server starts them before opening sockets, or  #
+    #    a worker keeps closed connections from ending       #
+    #--------------------------------------------------------#
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, os.getpid)
+
+    #--------------------------------------------------------#
+    #  Returns the solution of a board, joining the solve of #
+    #  an identical puzzle already in flight                 #
+    #  - The board is not modified                           #
+    #  - Waits for a free slot when max_pending distinct     #
+    #    puzzles are queued or solving                       #
+    #  - Returns n^2 x n^2 solution, all -1 if there is none #
+    #    and all -2 if the search gave up                    #
+    #--------------------------------------------------------#
+    async def solve(self, board):
+        start = time.perf_counter()
+        board = np.array(board, dtype=int)
+        key = (board.shape, board.tobytes())
+        self.requests += 1
+
+        task = self.in_flight.get(key)
+        if task is None:
+            self.waiting += 1
+            try:
+                await self.slots.acquire()
+            finally:
+                self.waiting -= 1
+
+            # The same puzzle may have been submitted while waiting
+            task = self.in_flight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self.run(key, board))
+                self.in_flight[key] = task
+            else:
+                self.slots.release()
+                self.coalesced += 1
+        else:
+            self.coalesced += 1
+
+        # Shielded, so a cancelled caller does not cancel the solve
+        # other callers are waiting on
+        solution = await asyncio.shield(task)
+        self.latencies.append(time.perf_counter() - start)
+
+        return solution.copy()
+
+    #--------------------------------------------------------#
+    #  Solves one distinct puzzle on the pool, then frees    #
+    #  its slot and in-flight entry                          #
+    #--------------------------------------------------------#
+    async def run(self, key, board):
+        loop = asyncio.get_running_loop()
+        try:
+            solution = await loop.run_in_executor(self.executor, self.solve_function, board)
+        finally:
+            del self.in_flight[key]
+            self.slots.release()
+
+        if solution.flat[0] == gave_up:
+            self.given_up += 1
+        elif solution.flat[0] < 0:
+            self.failed += 1
+        else:
+            self.solved += 1
+
+        return solution
+
+    #--------------------------------------------------------#
+    #  Returns dictionary of the request counters, the queue #
+    #  depth and the latency percentiles in milliseconds of  #
+    #  the last latency_window requests                      #
+    #  - queue_depth counts the callers waiting for a slot   #
+    #    and the puzzles submitted but not yet on a worker   #
+    #--------------------------------------------------------#
+    def metrics(self):
+        latency = {"p50": None, "p95": None, "p99": None, "max": None}
+        if self.latencies:
+            milliseconds = np.array(self.latencies) * 1000
+            latency = {"p50": float(np.percentile(milliseconds, 50)),
+                       "p95": float(np.percentile(milliseconds, 95)),
+                       "p99": float(np.percentile(milliseconds, 99)),
+                       "max": float(milliseconds.max())}
+
+        return {"workers": self.workers,
+                "max_pending": self.max_pending,
+                "queue_depth": self.waiting + max(0, len(self.in_flight) - self.workers),
+                "waiting": self.waiting,
+                "in_flight": len(self.in_flight),
+                "requests": self.requests,
+                "coalesced": self.coalesced,
+                "solved": self.solved,
+                "failed": self.failed,
+                "given_up": self.given_up,
+                "latency_ms": latency}
+
+    #--------------------------------------------------------#
+    #  Waits for the puzzles in flight and shuts the pool    #
+    #  down                                                  #
+    #--------------------------------------------------------#
+    async def close(self):
+        await asyncio.to_thread(self.executor.shutdown)
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                     HTTP SERVER FUNCTIONS                  #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+# Minimal HTTP/1.1 stand-in for load testing, not meant to
+# face the internet:
+#  - POST /solve with an 81 character puzzle line as the body
+#    answers with the solution line in the format of sudoku_io
+#  - GET /metrics answers with the metrics() dictionary as JSON
+# Connections are kept alive unless the client asks otherwise.
+max_body_size = 65536
+
+reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 431: "Request Header Fields Too Large",
+           500: "Internal Server Error"}
+
+#------------------------------------------------------------#
+#         Function to serve the requests of a connection     #
+#------------------------------------------------------------#
+#  - Takes SolverService and the asyncio stream reader and   #
+#    writer of a connection as input                         #
+#  - Answers requests in order until the client closes the   #
+#    connection or sends "Connection: close"                 #
+#  - Lines longer than the stream reader's limit (64 KiB)    #
+#    are answered with 400 for the request line and 431 for  #
+#    a header, and the connection is closed                  #
+#------------------------------------------------------------#
+
+
+async def handle_connection(service, reader, writer):
+    try:
+        while True:
+            try:
+                request_line = await reader.readline()
+            except (ValueError, asyncio.LimitOverrunError):
+                writer.write(format_response(400, "request line too long\n", keep_alive=False))
+                break
+            if not request_line:
+                break
+
+            headers = await read_headers(reader)
+            if headers is None:
+                writer.write(format_response(431, "header line too long\n", keep_alive=False))
+                break
+
+            parts = request_line.decode("latin-1").split()
+            length = headers.get("content-length", "0")
+            if len(parts) != 3 or not length.isdigit():
+                writer.write(format_response(400, "malformed request\n", keep_alive=False))
+                break
+            if int(length) > max_body_size:
+                writer.write(format_response(413, "body too large\n", keep_alive=False))
+                break
+
+            method, path, version = parts
+            body = await reader.readexactly(int(length))
+            status, content_type, payload = await handle_request(service, method, path, body)
+
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            writer.write(format_response(status, payload, content_type, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+#------------------------------------------------------------#
+#         Function to read the headers of a request          #
+#------------------------------------------------------------#
+#  - Takes asyncio stream reader as input                    #
+#  - Reads up to the blank line ending the headers           #
+#  - Returns dictionary of headers keyed by lower case name, #
+#    None if a line is longer than the reader's limit        #
+#------------------------------------------------------------#
+
+
+async def read_headers(reader):
+    headers = {}
+    while True:
+        try:
+            line = await reader.readline()
+        except (ValueError, asyncio.LimitOverrunError):
+            return None
+        if line in (b"\r\n", b"\n", b""):
+            return headers
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+#------------------------------------------------------------#
+#               Function to answer one request               #
+#------------------------------------------------------------#
+#  - Takes SolverService, method, path and body bytes as     #
+#    input                                                   #
+#  - Returns status code, content type and payload string    #
+#------------------------------------------------------------#
+
+
+async def handle_request(service, method, path, body):
+    path = path.split("?", 1)[0]
+
+    if path == "/metrics":
+        if method != "GET":
+            return 405, "text/plain", "use GET\n"
+        return 200, "application/json", json.dumps(service.metrics()) + "\n"
+
+    if path == "/solve":
+        if method != "POST":
+            return 405, "text/plain", "use POST\n"
+        try:
+            board = parse_line(body.decode("ascii", errors="replace"))
+        except ValueError as error:
+            return 400, "text/plain", "{}\n".format(error)
+        try:
+            solution = await service.solve(board)
+        except Exception as error:
+            # e.g. BrokenProcessPool after a worker crash
+            return 500, "text/plain", "solve failed: {}\n".format(str(error) or type(error).__name__)
+        return 200, "text/plain", format_board(solution) + "\n"
+
+    return 404, "text/plain", "not found\n"
+
+
+def format_response(status, payload, content_type="text/plain", keep_alive=True):
+    payload = payload.encode()
+    head = ("HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\n"
+            "Connection: {}\r\n\r\n".format(status, reasons[status], content_type, len(payload),
+                                            "keep-alive" if keep_alive else "close"))
+    return head.encode("latin-1") + payload
+
+#------------------------------------------------------------#
+#         Function to run the server until cancelled         #
+#------------------------------------------------------------#
+#  - Takes host, port and the SolverService arguments as     #
+#    input                                                   #
+#  - Calls ready with the bound (host, port) once listening, #
+#    port 0 picks a free port                                #
+#------------------------------------------------------------#
+
+
+async def serve(host="127.0.0.1", port=8080, ready=None, **service_options):
+    async with SolverService(**service_options) as service:
+        server = await asyncio.start_server(partial(handle_connection, service), host, port)
+        if ready is not None:
+            ready(server.sockets[0].getsockname()[:2])
+        async with server:
+            await server.serve_forever()
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                    COMMAND LINE INTERFACE                  #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+
+def main(argv=None):
+    """
+    Runs the HTTP stand-in server in front of a SolverService.
+
+    Usage
+        python -m sudoku_service [--host 127.0.0.1] [--port 8080] [-w 4]
+        curl -d 003020600900305001001806400008102900700000008006708200002609500800203009005010300 localhost:8080/solve
+        curl localhost:8080/metrics
+    """
+    parser = argparse.ArgumentParser(prog="python -m sudoku_service",
+                                     description="Serve Sudoku solves over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-w", "--workers", type=int,
+                        help="pool processes, defaults to the number of CPUs")
+    parser.add_argument("--max-pending", type=int,
+                        help="distinct puzzles queued or solving at once, defaults to 4 per worker")
+    parser.add_argument("--engine", default="bitmask", choices=engines)
+    parser.add_argument("--timeout", type=float,
+                        help="seconds after which a search gives up")
+    parser.add_argument("--max-nodes", type=int,
+                        help="search nodes after which a search gives up")
+    args = parser.parse_args(argv)
+
+    def ready(address):
+        print("listening on http://{}:{}".format(*address), file=sys.stderr, flush=True)
+
+    try:
+        asyncio.run(serve(args.host, args.port, ready, workers=args.workers,
+                          max_pending=args.max_pending, engine=args.engine,
+                          timeout=args.timeout, max_nodes=args.max_nodes))
+    except ValueError as error:
+        print("error: {}".format(error), file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
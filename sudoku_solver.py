@@ -1,25 +1,145 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from functools import lru_cache
+from itertools import islice
+from math import isqrt
+from random import Random
+
 import numpy as np
 
+from sudoku_board import Board
+from sudoku_io import (create_puzzle_file, format_board, open_puzzle_file, pack_boards,
+                       read_puzzles, unpack_boards)
+
 
-def sudoku_solver(sudoku):
+def sudoku_solver(sudoku, engine="backtrack", cache=None, stats=None, timeout=None,
+                  max_nodes=None, order=None):
     """
     Solves a Sudoku puzzle and returns its unique solution.
 
     Input
-        sudoku : 9x9 numpy array
-            Empty cells are designated by 0.
+        sudoku : n^2 x n^2 numpy array (9x9, 16x16, 25x25, ...) or Board
+            Empty cells are designated by 0. An array is solved in place, a
+            read-only array, such as a board of a file opened by
+            sudoku_io.open_puzzle_file, is copied and a Board is left
+            unchanged.
+        engine : str
+            "backtrack" uses the numpy set based CSP search, "bitmask" uses
+            the incremental row, column and box bitmask search and "dlx"
+            uses Algorithm X with dancing links on the exact cover form.
+            Every engine returns the same solution of a uniquely solvable
+            puzzle. A puzzle with several solutions may get a different
+            one from each engine.
+        cache : sudoku_cache.SolutionCache or None
+            Looks the puzzle up in the cache, solving and storing its
+            canonical form on a miss.
+        stats : SearchStats or None
+            Reset and filled with the counters and timings of this solve,
+            its callback is called once the solve finishes.
+        timeout : float or None
+            Seconds after which the search gives up.
+        max_nodes : int or None
+            Number of search nodes after which the search gives up.
+        order : SearchOrder, str or None
+            Variable and value ordering of the backtrack and bitmask
+            engines, or the name of one of orderings. None keeps the
+            engine's default ordering.
 
     Output
-        9x9 numpy array of integers
+        n^2 x n^2 numpy array of integers
             It contains the solution, if there is one. If there is no solution, all array entries should be -1.
+            If the search gave up on its timeout or node budget, all array entries are -2 (gave_up).
+            A Board if sudoku is a Board.
     """
 
     # YOUR CODE HERE
 
-    variables = get_variables(sudoku)
-    domains = get_domain(sudoku, variables)
+    if isinstance(sudoku, Board):
+        solution = sudoku_solver(sudoku.to_array().astype(int), engine, cache, stats, timeout,
+                                 max_nodes, order)
+        return Board.from_array(solution)
+
+    if engine not in engines:
+        raise ValueError("Unknown engine: {}".format(engine))
+
+    if isinstance(sudoku, np.ndarray) and not sudoku.flags.writeable:
+        sudoku = sudoku.copy()
+
+    if isinstance(order, str):
+        if order not in orderings:
+            raise ValueError("Unknown ordering: {}".format(order))
+        order = orderings[order]
+    strategy = get_strategy_name(engine, order)
+    if order is not None:
+        if engine == "dlx":
+            raise ValueError("the dlx engine has its own column ordering")
+        order = order.start()
+
+    limits = None
+    if timeout is not None or max_nodes is not None:
+        limits = SearchLimits(timeout, max_nodes)
+
+    if stats is None:
+        return solve_board(sudoku, engine, cache, limits=limits, order=order)
+
+    stats.start(engine, strategy)
+    solved_sudoku = solve_board(sudoku, engine, cache, stats, limits, order)
+    stats.finish(solved_sudoku.flat[0] > 0)
+    return solved_sudoku
+
+
+engines = ("backtrack", "bitmask", "dlx")
+
+# Value of every cell of the returned board when the search
+# gave up on its timeout or node budget. Unlike -1 it does not
+# mean that the puzzle has no solution.
+gave_up = -2
 
-    solved_sudoku = solve_by_backtrack(sudoku, variables, domains)
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                        MAIN FUNCTION                       #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+#------------------------------------------------------------#
+#       Function to solve a board with the given engine      #
+#------------------------------------------------------------#
+#  - Takes board, engine, cache, stats, search limits and    #
+#    search order as input                                   #
+#  - Returns the solved board, or the board filled with -1,  #
+#    or with gave_up if the limits were exceeded             #
+#------------------------------------------------------------#
+
+
+def solve_board(sudoku, engine, cache=None, stats=None, limits=None, order=None):
+
+    # Rejecting boards with repeated or out of range values before searching
+    if not is_valid_board(sudoku):
+        sudoku.fill(-1)
+        return sudoku
+
+    if cache is not None:
+        sudoku[:] = cache.solve(sudoku, engine=engine, limits=limits, stats=stats, order=order)
+        return sudoku
+
+    try:
+        if engine == "bitmask":
+            solved_sudoku = solve_by_bitmask(sudoku, stats=stats, limits=limits, order=order)
+        elif engine == "dlx":
+            solved_sudoku = solve_by_dlx(sudoku, stats=stats, limits=limits)
+        else:
+            variables = get_variables(sudoku)
+            domains = get_domain(sudoku, variables)
+
+            solved_sudoku = solve_by_backtrack(sudoku, variables, domains, stats=stats,
+                                               limits=limits, order=order)
+    except SearchLimitExceeded:
+        sudoku.fill(gave_up)
+        return sudoku
 
     if not check_board(sudoku):
         sudoku.fill(-1)
@@ -32,15 +152,1407 @@ def sudoku_solver(sudoku):
     return solved_sudoku
 
 
-domain = np.arange(1, 10)
+def solve_by_backtrack(board, variables, domains, stats=None, limits=None, order=None):
+    if order is None or not order.restarts:
+        return backtrack(board, variables, domains, stats, limits=limits, order=order)
+
+    # Every restart starts over from the given board
+    start = board.copy()
+
+    def search(limits):
+        board[:] = start
+        return backtrack(board, variables, domains, stats, limits=limits, order=order)
+
+    return search_with_restarts(search, order, limits, stats)
+
+
+def solve_by_bitmask(board, pairs=False, stats=None, limits=None, order=None):
+    state = SearchState(board)
+    if not state.is_consistent():
+        return -1
+
+    propagated = state.propagate(pairs) if stats is None else stats.propagate(state, pairs)
+    if not propagated:
+        return -1
+
+    if order is None or not order.restarts:
+        solved = backtrack_bitmask(state, pairs, stats, limits, order)
+    else:
+        # Every restart rolls the state back to the propagated board
+        mark = len(state.trail)
+
+        def search(limits):
+            state.undo(mark)
+            return backtrack_bitmask(state, pairs, stats, limits, order)
+
+        solved = search_with_restarts(search, order, limits, stats)
+    if not solved:
+        return -1
+
+    board[:] = np.reshape(state.values, board.shape)
+    return board
+
+
+def solve_by_dlx(board, stats=None, limits=None):
+    exact_cover = get_exact_cover(get_box_size(board)).copy()
+    solution = exact_cover.solve(board, stats, limits)
+    if solution is None:
+        return -1
+
+    size = len(board)
+    for row_id in solution:
+        cell, value = divmod(row_id, size)
+        board[cell // size, cell % size] = value + 1
+    return board
 
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
-#                        MAIN FUNCTION                       #
+#                   BATCH SOLVING FUNCTIONS                  #
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
 
 
-def solve_by_backtrack(board, variables, domains):
-    return backtrack(board, variables, domains)
+def solve_many(puzzles, workers=None, chunksize=64, engine="bitmask", return_timings=False,
+               timeout=None, max_nodes=None):
+    """
+    Solves a batch of Sudoku puzzles across a pool of processes.
+
+    Input
+        puzzles : (N, 9, 9) numpy array, or (N, n^2, n^2) for other sizes
+            Empty cells are designated by 0. The array is not modified.
+        workers : int or None
+            Number of worker processes, None uses one per CPU. With 1 the
+            chunks are solved in the calling process.
+        chunksize : int
+            Number of puzzles sent to a worker at a time.
+        engine : str
+            Engine passed on to sudoku_solver for the puzzles that batch
+            propagation (solve_batch) does not finish. It defaults to
+            bitmask rather than backtrack, so a puzzle with several
+            solutions may get a different one than from sudoku_solver.
+        return_timings : bool
+            Also return the per-chunk timings.
+        timeout, max_nodes : float, int or None
+            Limits of every single solve, passed on to sudoku_solver.
+
+    Output
+        numpy array of integers, same shape as puzzles
+            Solutions in input order, unsolvable puzzles are all -1 and
+            puzzles the search gave up on are all -2.
+        list of (start, stop, seconds) tuples, if return_timings is True
+            Wall-clock time spent by the worker on puzzles[start:stop].
+    """
+    puzzles = np.asarray(puzzles)
+    if puzzles.ndim != 3:
+        raise ValueError("puzzles must have shape (N, n^2, n^2), got {}".format(puzzles.shape))
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
+
+    solutions = np.empty(puzzles.shape, dtype=int)
+    timings = []
+    starts = range(0, len(puzzles), chunksize)
+
+    if workers == 1:
+        for start in starts:
+            chunk = puzzles[start:start + chunksize]
+            solutions[start:start + len(chunk)], seconds = solve_chunk(chunk, engine, timeout,
+                                                                       max_nodes)
+            timings.append((start, start + len(chunk), seconds))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(solve_chunk, puzzles[start:start + chunksize], engine,
+                                       timeout, max_nodes): start
+                       for start in starts}
+            for future in as_completed(futures):
+                start = futures[future]
+                chunk_solutions, seconds = future.result()
+                solutions[start:start + len(chunk_solutions)] = chunk_solutions
+                timings.append((start, start + len(chunk_solutions), seconds))
+        timings.sort()
+
+    if return_timings:
+        return solutions, timings
+    return solutions
+
+#------------------------------------------------------------#
+#         Function to solve one chunk of a batch             #
+#------------------------------------------------------------#
+#  - Takes (n, size, size) array of puzzles, engine and the  #
+#    limits of every solve as input                          #
+#  - Returns (n, size, size) array of solutions and the      #
+#    seconds spent solving the chunk                         #
+#------------------------------------------------------------#
+
+
+def solve_chunk(puzzles, engine, timeout=None, max_nodes=None):
+    start = time.perf_counter()
+    solutions = solve_batch(puzzles, engine, timeout, max_nodes)
+
+    return solutions, time.perf_counter() - start
+
+#------------------------------------------------------------#
+#      Function to lazily solve a stream of puzzles          #
+#------------------------------------------------------------#
+#  - Takes an iterable of 9x9 boards, number of workers,     #
+#    chunksize, engine and the limits of every solve as      #
+#    input                                                   #
+#  - Chunks go through solve_batch, the engine only searches #
+#    the boards propagation does not finish                  #
+#  - Yields solutions in input order                         #
+#  - At most two chunks per worker are read ahead, so memory #
+#    stays flat however long the stream is                   #
+#  - Raises ValueError if chunksize is below 1               #
+#------------------------------------------------------------#
+
+
+def solve_stream(puzzles, workers=1, chunksize=64, engine="bitmask", timeout=None,
+                 max_nodes=None):
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
+
+    puzzles = iter(puzzles)
+    chunks = iter(lambda: list(islice(puzzles, chunksize)), [])
+
+    if workers == 1:
+        for chunk in chunks:
+            yield from solve_batch(np.array(chunk, dtype=int), engine, timeout, max_nodes)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        limit = 2 * (workers or os.cpu_count() or 1)
+        for chunk in chunks:
+            pending.append(executor.submit(solve_chunk, np.array(chunk, dtype=int), engine,
+                                           timeout, max_nodes))
+            if len(pending) >= limit:
+                yield from pending.popleft().result()[0]
+        while pending:
+            yield from pending.popleft().result()[0]
+
+#------------------------------------------------------------#
+#       Function to solve a binary puzzle file into a        #
+#       matching memory-mapped solution file                 #
+#------------------------------------------------------------#
+#  - Takes input path, output path, number of workers,       #
+#    chunksize, engine and the limits of every solve as      #
+#    input                                                   #
+#  - Workers open both files themselves, so only the chunk   #
+#    offsets cross process boundaries                        #
+#  - Returns number of boards, number of failures, boards    #
+#    the search gave up on included, and number of boards    #
+#    the search gave up on                                   #
+#  - Raises ValueError if chunksize is below 1               #
+#------------------------------------------------------------#
+
+
+def solve_file(input_path, output_path, workers=None, chunksize=1024, engine="bitmask",
+               timeout=None, max_nodes=None):
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1")
+
+    records, packed = open_puzzle_file(input_path)
+    count = len(records)
+    create_puzzle_file(output_path, count, packed=packed).flush()
+    del records
+
+    starts = range(0, count, chunksize)
+    if workers == 1:
+        results = [solve_file_chunk(input_path, output_path, start, start + chunksize, engine,
+                                     timeout, max_nodes)
+                    for start in starts]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(solve_file_chunk, *zip(*[
+                (input_path, output_path, start, start + chunksize, engine, timeout, max_nodes)
+                for start in starts])))
+
+    return count, sum(failed for failed, _ in results), sum(given_up for _, given_up in results)
+
+#------------------------------------------------------------#
+#     Function to solve one chunk of a binary puzzle file    #
+#------------------------------------------------------------#
+#  - Takes input path, output path, chunk bounds, engine and #
+#    the limits of every solve as input                      #
+#  - The chunk is solved by solve_batch, which works on int   #
+#    copies of the boards, and the solutions are written     #
+#    back into the output memmap                             #
+#  - Returns number of failures and of boards the search     #
+#    gave up on in the chunk                                 #
+#------------------------------------------------------------#
+
+
+def solve_file_chunk(input_path, output_path, start, stop, engine, timeout=None, max_nodes=None):
+    records, packed = open_puzzle_file(input_path)
+    solutions = open_puzzle_file(output_path, mode="r+")[0]
+
+    if packed:
+        boards = unpack_boards(records[start:stop])
+    else:
+        boards = solutions[start:stop]
+        boards[:] = records[start:stop]
+
+    boards[:] = solve_batch(boards, engine, timeout, max_nodes)
+    failures = np.count_nonzero(boards[:, 0, 0] < 0)
+    given_up = np.count_nonzero(boards[:, 0, 0] == gave_up)
+
+    if packed:
+        solutions[start:stop] = pack_boards(boards)
+    solutions.flush()
+
+    return int(failures), int(given_up)
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                 BATCH PROPAGATION FUNCTIONS                #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+# Decisions a board may take in the lockstep batch search before
+# it is searched on its own, and boards below which the lockstep
+# rounds stop, a round over a few boards costs more than their
+# own searches
+batch_search_nodes = 16
+batch_search_boards = 8
+
+
+def solve_batch(puzzles, engine="bitmask", timeout=None, max_nodes=None):
+    """
+    Solves a batch of Sudoku puzzles, propagating all of them at once
+    before searching the ones propagation does not finish.
+
+    Input
+        puzzles : (N, n^2, n^2) numpy array
+            Empty cells are designated by 0. The array is not modified.
+        engine : str
+            Engine of the boards left unsolved by propagation. The bitmask
+            engine searches on from the propagated candidates, the others
+            are passed the propagated board through sudoku_solver.
+        timeout, max_nodes : float, int or None
+            Limits of every search.
+
+    Output
+        numpy array of integers, same shape as puzzles
+            Solutions in input order, unsolvable puzzles are all -1 and
+            puzzles the search gave up on are all -2.
+    """
+    puzzles = np.asarray(puzzles)
+    solutions = np.full(puzzles.shape, -1, dtype=int)
+    valid = np.flatnonzero(validate_boards(puzzles))
+    if len(valid) == 0:
+        return solutions
+
+    boards, status, candidates = propagate_batch(puzzles[valid], return_candidates=True)
+    solutions[valid[status == 1]] = boards[status == 1]
+
+    unsolved = np.flatnonzero(status == 0)
+    if engine == "bitmask" and timeout is None and max_nodes is None and len(unsolved):
+        solutions[valid[unsolved]] = search_batch(boards[unsolved], candidates[unsolved])
+        return solutions
+
+    for i in unsolved:
+        if engine == "bitmask":
+            solutions[valid[i]] = search_propagated(boards[i], candidates[i], timeout, max_nodes)
+        else:
+            solutions[valid[i]] = sudoku_solver(boards[i], engine=engine, timeout=timeout,
+                                                max_nodes=max_nodes)
+
+    return solutions
+
+#------------------------------------------------------------#
+#      Function to search a batch of boards in lockstep      #
+#------------------------------------------------------------#
+#  - Takes (N, size, size) boards at a propagation fixpoint  #
+#    and their (N, cells) candidate masks as input           #
+#  - Every board keeps its own stack of decisions, as the    #
+#    bitmask search does. Each round tries the next value of #
+#    every board and propagates all of the new boards with   #
+#    one propagate_batch call                                #
+#  - Branches on the first cell with the fewest candidates   #
+#    and tries values in ascending order, so the first       #
+#    solution found is the bitmask engine's                  #
+#  - A board leaves the rounds once it takes more than       #
+#    batch_search_nodes decisions, or once fewer than        #
+#    batch_search_boards boards are left, when the rounds    #
+#    cost more than they share. It is then searched on its   #
+#    own from its stack by resume_search                     #
+#  - Returns (N, size, size) int array of solutions, all -1  #
+#    for the boards without a solution                       #
+#------------------------------------------------------------#
+
+
+def search_batch(boards, candidates):
+    count, cells = candidates.shape
+    results = np.full(boards.shape, -1, dtype=int)
+    status = np.zeros(count, dtype=np.int8)
+    nodes = np.zeros(count, dtype=int)
+    stacks = [[] for _ in range(count)]
+    size = boards.shape[1]
+
+    expand = np.arange(count)
+    values = boards.reshape(count, cells).astype(int)
+    masks = candidates
+
+    while True:
+        # Branching every board that reached a fixpoint on its
+        # first cell with the fewest candidates
+        nodes[expand] += 1
+        sizes = np.where(values == 0, count_candidates(masks, size), size + 1)
+        branch_cells = np.argmin(sizes, axis=1)
+        for i, board, cell, mask in zip(expand, values, branch_cells, masks):
+            stacks[i].append((board, int(cell), int(mask[cell])))
+        active = [i for i in np.flatnonzero(status == 0)
+                  if stacks[i] and nodes[i] <= batch_search_nodes]
+        if len(active) < batch_search_boards:
+            break
+
+        # Taking the next value of every board, backing up to the
+        # previous decision when a cell runs out of values
+        tried, children = [], []
+        for i in active:
+            stack = stacks[i]
+            while stack and not stack[-1][2]:
+                stack.pop()
+            if not stack:
+                status[i] = -1
+                continue
+
+            board, cell, remaining = stack[-1]
+            bit = remaining & -remaining
+            stack[-1] = (board, cell, remaining ^ bit)
+            child = board.copy()
+            child[cell] = lowest_digit(bit)
+            tried.append(i)
+            children.append(child)
+        if not tried:
+            break
+
+        propagated, child_status, child_masks = propagate_batch(
+            np.reshape(children, (len(children),) + boards.shape[1:]), return_candidates=True)
+        tried = np.array(tried)
+        solved = child_status == 1
+        results[tried[solved]] = propagated[solved]
+        status[tried[solved]] = 1
+
+        fixpoint = child_status == 0
+        expand = tried[fixpoint]
+        values = propagated[fixpoint].reshape(len(expand), cells)
+        masks = child_masks[fixpoint]
+
+    for i in np.flatnonzero(status == 0):
+        results[i] = resume_search(stacks[i], boards.shape[1:])
+
+    return results
+
+#------------------------------------------------------------#
+#   Function to finish a search left by the lockstep rounds  #
+#------------------------------------------------------------#
+#  - Takes stack of (values, cell, untried values bitmask)   #
+#    decisions and board shape as input                      #
+#  - Searches the untried values from the latest decision    #
+#    back with the bitmask search, the order the search      #
+#    would have reached them in                              #
+#  - Returns the solved board, all -1 if there is none       #
+#------------------------------------------------------------#
+
+
+def resume_search(stack, shape):
+    for values, cell, remaining in reversed(stack):
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            board = values.reshape(shape).copy()
+            board.flat[cell] = lowest_digit(bit)
+            state = SearchState(board)
+            if state.propagate() and backtrack_bitmask(state):
+                return np.reshape(state.values, shape)
+
+    return np.full(shape, -1)
+
+#------------------------------------------------------------#
+#   Function to search a board propagated by the batch       #
+#   kernel                                                   #
+#------------------------------------------------------------#
+#  - Takes (size, size) board and (cells,) candidate masks   #
+#    from propagate_batch, and the limits of the search as   #
+#    input                                                   #
+#  - The search state starts from the masks, so the board is #
+#    neither validated nor propagated again                  #
+#  - Returns the solved board, all -1 if there is no         #
+#    solution or all gave_up if the limits were exceeded     #
+#------------------------------------------------------------#
+
+
+def search_propagated(board, candidates, timeout=None, max_nodes=None):
+    limits = None
+    if timeout is not None or max_nodes is not None:
+        limits = SearchLimits(timeout, max_nodes)
+
+    state = SearchState.from_candidates(board, candidates)
+    try:
+        solved = backtrack_bitmask(state, limits=limits)
+    except SearchLimitExceeded:
+        return np.full(board.shape, gave_up)
+    if not solved:
+        return np.full(board.shape, -1)
+
+    return np.reshape(state.values, board.shape)
+
+#------------------------------------------------------------#
+#     Function to propagate a batch of boards at once        #
+#------------------------------------------------------------#
+#  - Takes (N, size, size) array of valid boards and a flag  #
+#    to also return the candidates as input                  #
+#  - Holds an (N, cells) array of candidate bitmasks and     #
+#    applies naked and hidden singles to every board with    #
+#    array operations, rounds continue on the boards that    #
+#    changed until all of them reach a fixpoint              #
+#  - Every round removes the values of each cell's peers     #
+#    from its candidates, then assigns the cells with one    #
+#    candidate and the values with one place in a unit. A    #
+#    board is dead when a blank cell has no candidates, a    #
+#    value has no place in a unit, a value repeats among a   #
+#    cell's peers or a cell is forced to two values          #
+#  - Returns (N, size, size) int array of the propagated     #
+#    boards and (N,) status array: 1 solved, 0 unsolved at a #
+#    fixpoint and -1 for boards without a solution, and if   #
+#    asked the (N, cells) candidate masks, the bit of its    #
+#    value for an assigned cell                              #
+#------------------------------------------------------------#
+
+
+def propagate_batch(boards, return_candidates=False):
+    boards = np.asarray(boards)
+    geometry = get_geometry(get_box_size(np.empty(boards.shape[1:])))
+    size, cells = geometry.size, geometry.cells
+    dtype = get_mask_dtype(size)
+
+    values = boards.reshape(len(boards), cells).astype(int)
+    status = np.zeros(len(boards), dtype=np.int8)
+    full_mask = dtype(geometry.full_mask)
+    # Bitmask of every value, 0 for blank cells
+    value_bits = np.concatenate(([0], np.left_shift(1, np.arange(size)))).astype(dtype)
+
+    candidates = np.full(values.shape, full_mask, dtype=dtype)
+    active = np.arange(len(boards))
+
+    while len(active):
+        current = values[active]
+        blank = current == 0
+        assigned = value_bits[current]
+
+        # Removing the values of the peers from the candidates
+        used = np.bitwise_or.reduce(assigned[:, geometry.peer_array], axis=2)
+        masks = np.where(blank, candidates[active] & ~used, assigned)
+        candidates[active] = masks
+
+        dead = (np.any(blank & (masks == 0), axis=1) |
+                np.any(~blank & (assigned & used != 0), axis=1))
+
+        # Values seen once and more than once in every unit
+        unit_masks = masks[:, geometry.unit_array]
+        seen_once = np.zeros(unit_masks.shape[:2], dtype=dtype)
+        seen_twice = np.zeros(unit_masks.shape[:2], dtype=dtype)
+        for position in range(size):
+            seen_twice |= seen_once & unit_masks[:, :, position]
+            seen_once |= unit_masks[:, :, position]
+        dead |= np.any(seen_once != full_mask, axis=1)
+
+        # Naked singles, then hidden singles: the values with one
+        # place in any of the cell's units
+        hidden = np.bitwise_or.reduce((seen_once & ~seen_twice)[:, geometry.cell_units], axis=2)
+        single = blank & (masks & (masks - 1) == 0)
+        forced = np.where(single, masks, np.where(blank, hidden & masks, 0))
+        dead |= np.any(forced & (forced - 1) != 0, axis=1)
+
+        solved = ~dead & ~np.any(blank, axis=1)
+        changed = ~dead & ~solved & np.any(forced != 0, axis=1)
+        status[active[dead]] = -1
+        status[active[solved]] = 1
+
+        rows, columns = np.nonzero(forced[changed])
+        bits = forced[changed][rows, columns]
+        values[active[changed][rows], columns] = np.log2(bits).astype(int) + 1
+        active = active[changed]
+
+    if return_candidates:
+        return values.reshape(boards.shape), status, candidates
+    return values.reshape(boards.shape), status
+
+#------------------------------------------------------------#
+#     Function to count the candidates of a batch of cells   #
+#------------------------------------------------------------#
+#  - Takes array of candidate masks and number of values per #
+#    unit as input                                           #
+#  - Returns int array of the number of bits set in every    #
+#    mask                                                    #
+#------------------------------------------------------------#
+
+
+def count_candidates(masks, size):
+    counts = np.zeros(masks.shape, dtype=int)
+    for value in range(size):
+        counts += (masks >> value) & 1
+
+    return counts
+
+#------------------------------------------------------------#
+#      Function to get the bitmask type of a board size      #
+#------------------------------------------------------------#
+#  - Takes number of values per unit as input                #
+#  - Returns smallest unsigned numpy type with a bit for     #
+#    every value                                             #
+#------------------------------------------------------------#
+
+
+def get_mask_dtype(size):
+    for dtype in (np.uint16, np.uint32, np.uint64):
+        if size <= np.iinfo(dtype).bits:
+            return dtype
+    raise ValueError("batch propagation supports at most 64 values per unit")
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                  PARALLEL SEARCH FUNCTIONS                 #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+# Subproblems made per worker when no split depth is given,
+# several per worker so one hard branch does not leave the
+# other workers idle
+subproblems_per_worker = 4
+
+# Search nodes a puzzle is given on one core before it is
+# split, so puzzles that finish within them never wait on the
+# pool
+sequential_nodes = 500
+
+# Cancel event of the current worker process, set by
+# set_cancel_event when the pool starts the worker
+cancel_event = None
+
+
+def solve_parallel(board, workers=None, split_depth=None, engine="bitmask", pool=None,
+                   sequential_nodes=sequential_nodes):
+    """
+    Solves one Sudoku puzzle by searching the branches of its top MRV
+    levels in parallel.
+
+    Input
+        board : n^2 x n^2 numpy array
+            Empty cells are designated by 0.
+        workers : int or None
+            Number of worker processes, None uses one per CPU. With 1 the
+            subproblems are searched in the calling process.
+        split_depth : int or None
+            Number of MRV levels expanded into subproblems, None expands
+            levels until there are several subproblems per worker.
+        engine : str
+            Engine every subproblem is solved with.
+        pool : SplitPool or None
+            Pool the subproblems are searched on, overriding workers. None
+            uses the pool of the module for workers, started on first use
+            and kept for later calls.
+        sequential_nodes : int or None
+            Search nodes the puzzle is first given in the calling process.
+            Only a puzzle that needs more is split. None splits at once.
+
+    Output
+        n^2 x n^2 numpy array of integers
+            The board holding the solution found first, all -1 if there is
+            none. Once a worker finds a solution the others are cancelled
+            at their next search node.
+    """
+    if engine not in engines:
+        raise ValueError("Unknown engine: {}".format(engine))
+    if not is_valid_board(board):
+        board.fill(-1)
+        return board
+
+    if sequential_nodes is not None:
+        solution = solve_board(board.copy(), engine, limits=SearchLimits(max_nodes=sequential_nodes))
+        if solution.flat[0] != gave_up:
+            board[:] = solution
+            return board
+
+    if workers == 1 and pool is None:
+        for subproblem in split_board(board, split_depth, get_split_target(workers)):
+            solution = solve_board(subproblem, engine)
+            if solution.flat[0] > 0:
+                board[:] = solution
+                return board
+    else:
+        pool = pool or get_split_pool(workers)
+        subproblems = split_board(board, split_depth, get_split_target(pool.workers))
+        with pool.lock:
+            pool.cancel_event.clear()
+            futures = [pool.executor.submit(solve_subproblem, subproblem, engine)
+                       for subproblem in subproblems]
+            try:
+                for future in as_completed(futures):
+                    solution = future.result()
+                    if solution.flat[0] > 0:
+                        board[:] = solution
+                        return board
+            finally:
+                cancel_futures(pool.cancel_event, futures)
+
+    board.fill(-1)
+    return board
+
+
+def count_solutions_parallel(board, limit=None, workers=None, split_depth=None, pool=None,
+                             sequential_nodes=sequential_nodes):
+    """
+    Counts the solutions of a Sudoku puzzle by counting the branches of its
+    top MRV levels in parallel.
+
+    Input
+        board : n^2 x n^2 numpy array
+            Empty cells are designated by 0. The array is not modified.
+            Raises ValueError if it holds values outside 0 to n^2.
+        limit : int or None
+            Stop counting once this many solutions are found, None counts
+            every solution.
+        workers : int or None
+            Number of worker processes, None uses one per CPU. With 1 the
+            subproblems are counted in the calling process.
+        split_depth : int or None
+            Number of MRV levels expanded into subproblems, None expands
+            levels until there are several subproblems per worker.
+        pool : SplitPool or None
+            Pool the subproblems are counted on, overriding workers. None
+            uses the pool of the module for workers, started on first use
+            and kept for later calls.
+        sequential_nodes : int or None
+            Search nodes the count is first given in the calling process.
+            Only a count that needs more is split. None splits at once.
+
+    Output
+        int
+            Number of solutions found, at most limit. 0 if the givens
+            conflict or there is no solution.
+    """
+    if limit is None:
+        limit = float("inf")
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    if not check_count_board(board):
+        return 0
+
+    if sequential_nodes is not None:
+        state = SearchState(board)
+        if not (state.is_consistent() and state.propagate()):
+            return 0
+        try:
+            return count_bitmask(state, limit, SearchLimits(max_nodes=sequential_nodes))
+        except SearchLimitExceeded:
+            pass
+
+    count = 0
+
+    if workers == 1 and pool is None:
+        for subproblem in split_board(board, split_depth, get_split_target(workers)):
+            count += count_subproblem(subproblem, limit - count)
+            if count >= limit:
+                break
+    else:
+        pool = pool or get_split_pool(workers)
+        subproblems = split_board(board, split_depth, get_split_target(pool.workers))
+        with pool.lock:
+            pool.cancel_event.clear()
+            futures = [pool.executor.submit(count_subproblem, subproblem, limit)
+                       for subproblem in subproblems]
+            try:
+                for future in as_completed(futures):
+                    count += future.result()
+                    if count >= limit:
+                        break
+            finally:
+                cancel_futures(pool.cancel_event, futures)
+
+    return min(count, limit)
+
+#------------------------------------------------------------#
+#   Process pool reused by the parallel split functions      #
+#------------------------------------------------------------#
+#  - Starting a pool costs tens of milliseconds, more than   #
+#    most puzzles take to solve, so a pool is started once   #
+#    and kept                                                #
+#  - The workers share one cancel event, cleared at the      #
+#    start of every call. The lock keeps calls on the same   #
+#    pool from overlapping, so one call never cancels        #
+#    another                                                 #
+#------------------------------------------------------------#
+class SplitPool:
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.cancel_event = multiprocessing.Event()
+        self.lock = threading.Lock()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers,
+                                            initializer=set_cancel_event,
+                                            initargs=(self.cancel_event,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+#------------------------------------------------------------#
+#       Function to get the split pool of the module         #
+#------------------------------------------------------------#
+#  - Takes number of workers as input, None for one per CPU  #
+#  - Returns the SplitPool started on the first call with    #
+#    the same number of workers                              #
+#------------------------------------------------------------#
+
+
+@lru_cache(maxsize=None)
+def get_split_pool(workers=None):
+    return SplitPool(workers)
+
+#------------------------------------------------------------#
+#     Function to split a board into independent boards      #
+#------------------------------------------------------------#
+#  - Takes board, number of MRV levels to expand and the     #
+#    number of subproblems to reach when no depth is given   #
+#    as input                                                #
+#  - Every level assigns each candidate of the MRV cell of   #
+#    every board and propagates it, boards that fail are     #
+#    dropped and complete boards are kept as they are        #
+#  - The subproblems partition the solutions of the board,   #
+#    in the order the sequential search would reach them     #
+#  - Returns list of boards                                  #
+#------------------------------------------------------------#
+
+
+def split_board(board, split_depth=None, target=1):
+    state = SearchState(board)
+    if not (state.is_consistent() and state.propagate()):
+        return []
+
+    frontier = [list(state.values)]
+    level = 0
+    while frontier and (len(frontier) < target if split_depth is None else level < split_depth):
+        expanded = []
+        for values in frontier:
+            state = SearchState(np.reshape(values, board.shape))
+            cell = state.select_unassigned_cell()
+            if cell == -1:
+                expanded.append(values)
+                continue
+
+            remaining = state.candidates[cell]
+            mark = len(state.trail)
+            while remaining:
+                bit = remaining & -remaining
+                remaining ^= bit
+                if state.assign(cell, lowest_digit(bit)) and state.propagate():
+                    expanded.append(list(state.values))
+                state.undo(mark)
+
+        # Stopping once every board is complete
+        if expanded == frontier:
+            break
+        frontier = expanded
+        level += 1
+
+    return [np.reshape(values, board.shape) for values in frontier]
+
+
+def get_split_target(workers):
+    return subproblems_per_worker * (workers or os.cpu_count() or 1)
+
+#------------------------------------------------------------#
+#      Functions run in the worker processes of a split      #
+#------------------------------------------------------------#
+#  - set_cancel_event is the pool initializer, the solve and #
+#    count functions stop at their next search node once the #
+#    event is set                                            #
+#  - solve_subproblem returns the solved board, all -1 or    #
+#    all -2 when cancelled                                   #
+#  - count_subproblem returns number of solutions, at most   #
+#    limit, or 0 when cancelled                              #
+#------------------------------------------------------------#
+
+
+def set_cancel_event(event):
+    global cancel_event
+    cancel_event = event
+
+
+def solve_subproblem(board, engine):
+    return solve_board(board, engine, limits=SearchLimits(cancel_event=cancel_event))
+
+
+def count_subproblem(board, limit):
+    state = SearchState(board)
+    if not (state.is_consistent() and state.propagate()):
+        return 0
+
+    try:
+        return count_bitmask(state, limit, SearchLimits(cancel_event=cancel_event))
+    except SearchLimitExceeded:
+        return 0
+
+#------------------------------------------------------------#
+#   Function to stop the workers of a split once it is done  #
+#------------------------------------------------------------#
+#  - Takes cancel event and futures as input                 #
+#  - Pending futures are cancelled and running workers stop  #
+#    at their next search node, which is waited for so the   #
+#    pool is idle for the next call                          #
+#------------------------------------------------------------#
+
+
+def cancel_futures(event, futures):
+    event.set()
+    for future in futures:
+        future.cancel()
+    wait(futures)
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                    COMMAND LINE INTERFACE                  #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+
+def main(argv=None):
+    """
+    Solves a file of 81 character puzzles, one per line, and writes the
+    solutions line by line in the same order.
+
+    Usage
+        python -m sudoku_solver [input] [-o output] [-w workers]
+
+    A summary of throughput and failures is printed to stderr.
+    """
+    parser = argparse.ArgumentParser(prog="python -m sudoku_solver",
+                                     description="Solve 81 character per line Sudoku puzzles.")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="puzzle file, '-' or omitted for stdin")
+    parser.add_argument("-o", "--output", default="-",
+                        help="solution file, '-' or omitted for stdout")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of worker processes, 0 for one per CPU")
+    parser.add_argument("--chunksize", type=int, default=64,
+                        help="puzzles sent to a worker at a time")
+    parser.add_argument("--engine", default="bitmask", choices=engines)
+    parser.add_argument("--binary", action="store_true",
+                        help="input and output are binary puzzle files (see sudoku_io)")
+    parser.add_argument("--timeout", type=float,
+                        help="seconds after which the search gives up on a puzzle")
+    parser.add_argument("--max-nodes", type=int,
+                        help="search nodes after which the search gives up on a puzzle")
+    args = parser.parse_args(argv)
+
+    if args.chunksize < 1:
+        parser.error("--chunksize must be at least 1")
+
+    if args.binary:
+        if args.input == "-" or args.output == "-":
+            parser.error("--binary needs an input file and an output file")
+        start = time.perf_counter()
+        try:
+            total, failed, given_up = solve_file(args.input, args.output, args.workers or None,
+                                                 args.chunksize, args.engine, args.timeout,
+                                                 args.max_nodes)
+        except (OSError, ValueError) as error:
+            print("error: {}".format(error), file=sys.stderr)
+            return 2
+        print_summary(total, failed, time.perf_counter() - start, given_up)
+        return 0
+
+    input_file = output_file = None
+    total = failed = given_up = 0
+    start = time.perf_counter()
+    try:
+        input_file = sys.stdin if args.input == "-" else open(args.input)
+        output_file = sys.stdout if args.output == "-" else open(args.output, "w")
+        puzzles = read_puzzles(input_file)
+        solutions = solve_stream(puzzles, args.workers or None, args.chunksize, args.engine,
+                                 args.timeout, args.max_nodes)
+        for solution in solutions:
+            total += 1
+            if solution[0, 0] < 0:
+                failed += 1
+                given_up += solution[0, 0] == gave_up
+            output_file.write(format_board(solution) + "\n")
+    except (OSError, ValueError) as error:
+        print("error: {}".format(error), file=sys.stderr)
+        return 2
+    finally:
+        if input_file not in (None, sys.stdin):
+            input_file.close()
+        if output_file not in (None, sys.stdout):
+            output_file.close()
+
+    print_summary(total, failed, time.perf_counter() - start, given_up)
+    return 0
+
+
+def print_summary(total, failed, elapsed, given_up=0):
+    print("{} puzzles, {} solved, {} failed{} in {:.2f}s ({:.1f} puzzles/s)".format(
+        total, total - failed, failed, " ({} gave up)".format(given_up) if given_up else "",
+        elapsed, total / elapsed if elapsed else 0.0),
+        file=sys.stderr)
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                   SEARCH STATISTICS                        #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+
+class SearchStats:
+    """
+    Counters and timings of one solve, filled when passed to sudoku_solver.
+
+    The engines only check whether a stats object was given, so solving
+    without one costs nothing beyond that check.
+
+    Input
+        callback : callable or None
+            Called with the stats object once each solve finishes, e.g. to
+            export the counters to a metrics system.
+
+    Attributes
+        engine : str
+            Engine used for the solve.
+        strategy : str
+            Variable and value ordering the search used, the name of the
+            SearchOrder or the engine's default.
+        decisions : int
+            Values tried by the search on a branching variable.
+        backtracks : int
+            Tried values that were undone because they led to a failure.
+        max_depth : int
+            Deepest number of nested decisions.
+        inferred : int
+            Cells filled by inference or propagation rather than branching,
+            counting cells that were later undone.
+        choice_sizes : list of int
+            Domain size of the variable chosen by MRV at every branch point,
+            in the order the branches were made.
+        restarts : int
+            Randomized restarts made by the search, counters cover every
+            run.
+        propagation_time, branching_time, total_time : float
+            Seconds spent in inference or propagation, in the rest of the
+            solve, and in the whole solve.
+        solved : bool
+            Whether a solution was found.
+
+    Usage
+        stats = SearchStats(callback=print)
+        solution = sudoku_solver(sudoku, engine="bitmask", stats=stats)
+        stats.decisions, stats.backtracks, stats.as_dict()
+    """
+
+    __slots__ = ("callback", "engine", "strategy", "decisions", "backtracks", "max_depth",
+                 "inferred", "choice_sizes", "restarts", "propagation_time", "total_time",
+                 "solved", "started")
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.start(None)
+
+    #--------------------------------------------------------#
+    #  Resets the counters and starts the solve timer        #
+    #--------------------------------------------------------#
+    def start(self, engine, strategy=None):
+        self.engine = engine
+        self.strategy = strategy
+        self.decisions = 0
+        self.backtracks = 0
+        self.max_depth = 0
+        self.inferred = 0
+        self.choice_sizes = []
+        self.restarts = 0
+        self.propagation_time = 0.0
+        self.total_time = 0.0
+        self.solved = False
+        self.started = time.perf_counter()
+
+    #--------------------------------------------------------#
+    #  Stops the solve timer and calls the callback          #
+    #--------------------------------------------------------#
+    def finish(self, solved):
+        self.total_time = time.perf_counter() - self.started
+        self.solved = bool(solved)
+        if self.callback is not None:
+            self.callback(self)
+
+    @property
+    def branching_time(self):
+        return max(self.total_time - self.propagation_time, 0.0)
+
+    #--------------------------------------------------------#
+    #  Records a branch point at depth whose variable has    #
+    #  size values left                                      #
+    #--------------------------------------------------------#
+    def choice(self, depth, size):
+        self.choice_sizes.append(size)
+        if depth >= self.max_depth:
+            self.max_depth = depth + 1
+
+    #--------------------------------------------------------#
+    #  Runs SearchState.propagate, timing it and counting    #
+    #  the cells it fills                                    #
+    #--------------------------------------------------------#
+    def propagate(self, state, pairs=False):
+        blanks = state.values.count(0)
+        start = time.perf_counter()
+        result = state.propagate(pairs)
+        self.propagation_time += time.perf_counter() - start
+        self.inferred += blanks - state.values.count(0)
+        return result
+
+    def as_dict(self):
+        return {"engine": self.engine, "strategy": self.strategy, "solved": self.solved,
+                "decisions": self.decisions, "backtracks": self.backtracks,
+                "max_depth": self.max_depth, "inferred": self.inferred,
+                "choice_sizes": list(self.choice_sizes), "restarts": self.restarts,
+                "propagation_time": self.propagation_time,
+                "branching_time": self.branching_time, "total_time": self.total_time}
+
+    def __repr__(self):
+        return ("SearchStats(engine={!r}, strategy={!r}, solved={}, decisions={}, backtracks={}, "
+                "max_depth={}, inferred={}, total_time={:.6f})".format(
+                    self.engine, self.strategy, self.solved, self.decisions, self.backtracks,
+                    self.max_depth, self.inferred, self.total_time))
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                      SEARCH LIMITS                         #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+
+class SearchLimitExceeded(Exception):
+    pass
+
+#------------------------------------------------------------#
+#   Timeout and node budget of one solve                     #
+#------------------------------------------------------------#
+#  - The engines call check() once per search node, so the   #
+#    search is cancelled cooperatively by unwinding with     #
+#    SearchLimitExceeded, without signals or threads         #
+#  - The deadline is fixed when the limits are created, so   #
+#    validation and setup count towards the timeout          #
+#  - cancel_event is a multiprocessing.Event that stops the  #
+#    search once set, from any process                       #
+#  - cutoff is the node count at which the current run of a  #
+#    restarting search raises SearchRestart, set by          #
+#    search_with_restarts                                    #
+#------------------------------------------------------------#
+class SearchLimits:
+
+    __slots__ = ("deadline", "max_nodes", "nodes", "cancel_event", "cutoff")
+
+    def __init__(self, timeout=None, max_nodes=None, cancel_event=None):
+        if timeout is not None and timeout < 0:
+            raise ValueError("timeout must not be negative")
+        if max_nodes is not None and max_nodes < 0:
+            raise ValueError("max_nodes must not be negative")
+
+        self.deadline = None if timeout is None else time.perf_counter() + timeout
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.cancel_event = cancel_event
+        self.cutoff = None
+
+    #--------------------------------------------------------#
+    #  Counts a search node                                  #
+    #  - Raises SearchLimitExceeded past the node budget or  #
+    #    the deadline, or once the cancel event is set, and  #
+    #    SearchRestart past the cutoff                       #
+    #--------------------------------------------------------#
+    def check(self):
+        self.nodes += 1
+        if self.cutoff is not None and self.nodes > self.cutoff:
+            raise SearchRestart()
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise SearchLimitExceeded("node budget of {} exceeded".format(self.max_nodes))
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchLimitExceeded("timeout exceeded")
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise SearchLimitExceeded("search cancelled")
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                      SEARCH ORDERING                       #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+variable_orders = ("mrv", "mrv-degree")
+value_orders = ("ascending", "lcv")
+
+# Ordering of one solve, made by SearchOrder.start and passed
+# down the search in its place
+#  - variables, values, restarts and restart_nodes are those
+#    of the SearchOrder
+#  - random is the Random the ties of this solve are broken
+#    with, None without restarts
+OrderRun = namedtuple("OrderRun", ["variables", "values", "restarts", "restart_nodes", "random"])
+
+
+class SearchOrder:
+    """
+    Variable and value ordering strategy of the backtrack and bitmask
+    engines, passed to sudoku_solver.
+
+    Input
+        variables : str
+            "mrv" branches on the first blank cell in board order with the
+            fewest candidates, "mrv-degree" breaks ties between such cells
+            by their number of blank peers, most first.
+        values : str
+            "ascending" tries the candidates from the lowest value up, "lcv"
+            first tries the value that removes the fewest candidates from
+            the blank peers (least constraining value).
+        restarts : int
+            Number of randomized restarts, 0 for a single deterministic run.
+            With restarts, ties of both orderings are broken at random,
+            "ascending" values are tried in random order, and the search
+            starts over once a run has used restart_nodes nodes, twice as
+            many for the next run and so on. The run after the last restart
+            has no cutoff, so the search stays complete.
+        restart_nodes : int
+            Node cutoff of the first run.
+        seed : int or None
+            Seed of the random tie-breaking. Every solve starts from the
+            seed, so solving the same puzzle twice takes the same path.
+
+    Attributes
+        name : str
+            Name of the strategy, reported in SearchStats.strategy.
+
+    Usage
+        order = SearchOrder("mrv-degree", "lcv", restarts=8, seed=1)
+        solution = sudoku_solver(sudoku, engine="bitmask", order=order, stats=stats)
+        stats.strategy, stats.restarts
+
+    A SearchOrder is immutable, so one order, such as the presets in
+    orderings, can be shared by solves running at the same time.
+    """
+
+    __slots__ = ("variables", "values", "restarts", "restart_nodes", "seed")
+
+    def __init__(self, variables="mrv", values="ascending", restarts=0, restart_nodes=64,
+                 seed=None):
+        if variables not in variable_orders:
+            raise ValueError("Unknown variable ordering: {}".format(variables))
+        if values not in value_orders:
+            raise ValueError("Unknown value ordering: {}".format(values))
+        if restarts < 0:
+            raise ValueError("restarts must not be negative")
+        if restart_nodes < 1:
+            raise ValueError("restart_nodes must be at least 1")
+
+        object.__setattr__(self, "variables", variables)
+        object.__setattr__(self, "values", values)
+        object.__setattr__(self, "restarts", restarts)
+        object.__setattr__(self, "restart_nodes", restart_nodes)
+        object.__setattr__(self, "seed", seed)
+
+    @property
+    def name(self):
+        name = "{}+{}".format(self.variables, self.values)
+        if self.restarts:
+            name += "+restarts({}, seed={})".format(self.restarts, self.seed)
+        return name
+
+    #--------------------------------------------------------#
+    #  Returns the OrderRun of a new solve, with a Random    #
+    #  seeded afresh when there are restarts                 #
+    #--------------------------------------------------------#
+    def start(self):
+        return OrderRun(self.variables, self.values, self.restarts, self.restart_nodes,
+                        Random(self.seed) if self.restarts else None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SearchOrder is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("SearchOrder is immutable")
+
+    def __repr__(self):
+        return "SearchOrder({!r})".format(self.name)
+
+# Named strategies, accepted by sudoku_solver in place of a
+# SearchOrder and run by the benchmarks with --orderings
+orderings = {"mrv": SearchOrder(),
+             "mrv-degree": SearchOrder("mrv-degree"),
+             "lcv": SearchOrder(values="lcv"),
+             "mrv-degree-lcv": SearchOrder("mrv-degree", "lcv"),
+             "restarts": SearchOrder("mrv-degree", "lcv", restarts=8, seed=0)}
+
+# Ordering of every engine when no SearchOrder is given
+default_strategies = {"backtrack": "mrv+ascending", "bitmask": "mrv+ascending",
+                      "dlx": "min-column"}
+
+
+def get_strategy_name(engine, order):
+    return default_strategies[engine] if order is None else order.name
+
+
+class SearchRestart(Exception):
+    pass
+
+#------------------------------------------------------------#
+#      Function to run a search with randomized restarts     #
+#------------------------------------------------------------#
+#  - Takes search function, OrderRun, the SearchLimits of    #
+#    the solve and SearchStats as input                      #
+#  - search(limits) has to start over from the initial board #
+#    and return its result. Each run but the last gets a     #
+#    node cutoff, doubled on every restart, and is abandoned #
+#    with SearchRestart once past it                         #
+#  - The solve's own node budget, deadline and cancel event  #
+#    keep counting across runs                               #
+#  - Returns the result of the first run that finishes       #
+#------------------------------------------------------------#
+
+
+def search_with_restarts(search, order, limits=None, stats=None):
+    if limits is None:
+        limits = SearchLimits()
+
+    cutoff = order.restart_nodes
+    try:
+        for _ in range(order.restarts):
+            limits.cutoff = limits.nodes + cutoff
+            try:
+                return search(limits)
+            except SearchRestart:
+                cutoff *= 2
+                if stats is not None:
+                    stats.restarts += 1
+
+        limits.cutoff = None
+        return search(limits)
+    finally:
+        limits.cutoff = None
+
+#------------------------------------------------------------#
+#     Function to select the branching variable of the       #
+#     numpy CSP search                                       #
+#------------------------------------------------------------#
+#  - Takes board, variables, their domains and OrderRun      #
+#    as input                                                #
+#  - Returns index of the variable to branch on              #
+#------------------------------------------------------------#
+
+
+def select_backtrack_variable(board, variables, domains, order):
+    lengths = [len(domain) for domain in domains]
+    min_len = min(lengths)
+    tied = [i for i, length in enumerate(lengths) if length == min_len]
+
+    if order.variables == "mrv-degree" and len(tied) > 1:
+        size = len(board)
+        peer_array = get_geometry(isqrt(size)).peer_array
+        blank = np.ravel(board) == 0
+        degrees = [np.count_nonzero(blank[peer_array[size*variables[i][0] + variables[i][1]]])
+                   for i in tied]
+        most = max(degrees)
+        tied = [i for i, degree in zip(tied, degrees) if degree == most]
+
+    return tied[0] if order.random is None else order.random.choice(tied)
+
+#------------------------------------------------------------#
+#     Function to order the values of a variable of the      #
+#     numpy CSP search                                       #
+#------------------------------------------------------------#
+#  - Takes board, variable's position and domain, all        #
+#    variables, their domains and OrderRun as input          #
+#  - LCV counts for every value the blank peers whose domain #
+#    holds it, the values that rule out the fewest come      #
+#    first                                                   #
+#  - Returns list of values in the order to try them         #
+#------------------------------------------------------------#
+
+
+def order_backtrack_values(board, row, column, domain, variables, domains, order):
+    values = [int(value) for value in domain]
+    if order.random is not None:
+        order.random.shuffle(values)
+
+    if order.values == "lcv":
+        size = len(board)
+        peers = set(get_geometry(isqrt(size)).peer_array[size*row + column].tolist())
+        constrained = dict.fromkeys(values, 0)
+        for (peer_row, peer_column), peer_domain in zip(variables, domains):
+            if size*peer_row + peer_column in peers:
+                for value in peer_domain:
+                    if value in constrained:
+                        constrained[value] += 1
+        # Stable, so ties keep the ascending or shuffled order
+        values.sort(key=constrained.get)
+
+    return values
+
+#------------------------------------------------------------#
+#     Function to select the branching cell of the bitmask   #
+#     search                                                 #
+#------------------------------------------------------------#
+#  - Takes SearchState and OrderRun as input                 #
+#  - Same MRV scan as SearchState.select_unassigned_cell,    #
+#    but keeps every cell tied for fewest candidates         #
+#  - Returns index of the cell to branch on, -1 if every     #
+#    cell is assigned                                        #
+#------------------------------------------------------------#
+
+
+def select_bitmask_cell(state, order):
+    candidates = state.candidates
+    values = state.values
+    min_len = state.geometry.size + 1
+    tied = []
+
+    for cell, value in enumerate(values):
+        if not value:
+            count = candidates[cell].bit_count()
+            if count < min_len:
+                min_len = count
+                tied = [cell]
+            elif count == min_len:
+                tied.append(cell)
+
+    # A cell with one candidate or none leaves nothing to choose
+    if len(tied) < 2 or min_len <= 1:
+        return tied[0] if tied else -1
+
+    if order.variables == "mrv-degree":
+        cell_peers = state.geometry.cell_peers
+        degrees = [sum(not values[peer] for peer in cell_peers[cell]) for cell in tied]
+        most = max(degrees)
+        tied = [cell for cell, degree in zip(tied, degrees) if degree == most]
+
+    return tied[0] if order.random is None else order.random.choice(tied)
+
+#------------------------------------------------------------#
+#     Function to order the candidates of a cell of the      #
+#     bitmask search                                         #
+#------------------------------------------------------------#
+#  - Takes SearchState, cell and OrderRun as input           #
+#  - LCV counts for every candidate the blank peers that     #
+#    still hold it, the candidates that rule out the fewest  #
+#    come first                                              #
+#  - Returns list of candidate bits in the order to try them #
+#------------------------------------------------------------#
+
+
+def order_bitmask_values(state, cell, order):
+    bits = []
+    remaining = state.candidates[cell]
+    while remaining:
+        bit = remaining & -remaining
+        remaining ^= bit
+        bits.append(bit)
+    if order.random is not None:
+        order.random.shuffle(bits)
+
+    if order.values == "lcv":
+        candidates = state.candidates
+        values = state.values
+        blank_peers = [peer for peer in state.geometry.cell_peers[cell] if not values[peer]]
+        # Stable, so ties keep the ascending or shuffled order
+        bits.sort(key=lambda bit: sum(1 for peer in blank_peers if candidates[peer] & bit))
+
+    return bits
 
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
 #                       BACTRACK FUNCTION                    #
@@ -49,7 +1561,10 @@ def solve_by_backtrack(board, variables, domains):
 #------------------------------------------------------------#
 #         Function to find solution or return failure        #
 #------------------------------------------------------------#
-#  - Takes board, variables and domains as input             #
+#  - Takes board, variables and domains as input, and the    #
+#    SearchStats to fill with the current depth, the         #
+#    SearchLimits to check at every node and the OrderRun    #
+#    of variables and values                                 #
 #  - Returns a solution or failure                           #
 #------------------------------------------------------------#
 
@@ -57,7 +1572,7 @@ def solve_by_backtrack(board, variables, domains):
 #----------------------------Algorithm------------------------------#
 # function BACKTRACK(assignment, csp) return a solution or failure  #
 # ------------------------------------------------------------------#
-def backtrack(board, variables, domains):
+def backtrack(board, variables, domains, stats=None, depth=0, limits=None, order=None):
 
     # Define failure as -1
     failure = -1
@@ -73,21 +1588,36 @@ def backtrack(board, variables, domains):
     if len(variables) == 1:
         row, column = variables[0]
         board[row, column] = domains[0][0]
+        if stats is not None:
+            stats.inferred += 1
         return board
 
+    if limits is not None:
+        limits.check()
+
     #--------------Algorithm---------------#
     # var ← SELECT_UNASSIGNED_VARIABLE(csp) #
     # -------------------------------------#
     # Implementing MRV by selecting the variable with least domain values
-    min_len = min(map(len, domains))
-    for i, domain in enumerate(domains):
-        if len(domain) == min_len:
-            variable = variables[i]
-            # Unpacking variable
-            row, column = variable
-            # Selected variable's domain
-            domain_values = domain
-            break
+    if order is None:
+        min_len = min(map(len, domains))
+        for i, domain in enumerate(domains):
+            if len(domain) == min_len:
+                variable = variables[i]
+                # Unpacking variable
+                row, column = variable
+                # Selected variable's domain
+                domain_values = domain
+                break
+    else:
+        # Breaking MRV ties and ordering the domain values by the strategy
+        i = select_backtrack_variable(board, variables, domains, order)
+        row, column = variables[i]
+        domain_values = order_backtrack_values(board, row, column, domains[i], variables,
+                                               domains, order)
+
+    if stats is not None:
+        stats.choice(depth, len(domain_values))
 
     #---------------------------Algorithm----------------------------#
     # for each value in ORDER-DOMAIN-VALUES(var, assignment, csp) do #
@@ -108,25 +1638,30 @@ def backtrack(board, variables, domains):
             #---------------------------------#
             # Assigning value to the board variable
             board[row, column] = value
-            # Creating a copy of the board to pass to inference function
-            board_cpy = board.copy()
 
             #----------------Algorithm----------------#
             # inferences ←INFERENCE(csp, var , value) #
             #-----------------------------------------#
-            # Passing the board copy to the get inferences
-            inferences = get_inference(board_cpy, row, column, value)
+            # Passing the board itself to the get inferences, the
+            # inferences list is the trail of cells it fills
+            if stats is None:
+                inferences = get_inference(board, row, column, value)
+            else:
+                stats.decisions += 1
+                inference_start = time.perf_counter()
+                inferences = get_inference(board, row, column, value)
+                stats.propagation_time += time.perf_counter() - inference_start
+                if inferences != failure:
+                    stats.inferred += len(inferences)
 
             #---------------Algorithm-----------------#
             # if inferences != failure then           #
             #-----------------------------------------#
             if inferences != failure:
-                for inference in inferences:
-                    variable, variable_value = inference
-                    #-----------Algorithm----------#
-                    # add inferences to assignment #
-                    #------------------------------#
-                    board[variable[0], variable[1]] = variable_value[0]
+                #-----------Algorithm----------#
+                # add inferences to assignment #
+                #------------------------------#
+                # The inferences are already placed on the board
 
                 variables = get_variables(board)
                 domains = get_domain(board, variables)
@@ -134,7 +1669,7 @@ def backtrack(board, variables, domains):
                 #-------------Algorithm--------------#
                 # result ← BACKTRACK(assignment, csp) #
                 #------------------------------------#
-                result = backtrack(board, variables, domains)
+                result = backtrack(board, variables, domains, stats, depth + 1, limits, order)
 
                 #---------Algorithm----------#
                 # if result != failure then  #
@@ -146,9 +1681,12 @@ def backtrack(board, variables, domains):
         #---------------------Algorithm-----------------------#
         # remove {var = value} and inferences from assignment #
         #-----------------------------------------------------#
+        if stats is not None and board[row, column] != 0:
+            stats.backtracks += 1
         board[row, column] = 0
+        # A failed inference only rules out this value
         if isinstance(inferences, int):
-            return -1
+            continue
         for inference in inferences:
             variable, variable_value = inference
             board[variable[0], variable[1]] = 0
@@ -158,6 +1696,813 @@ def backtrack(board, variables, domains):
     #-----------------#
     return failure
 
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                 BITMASK BACKTRACK FUNCTIONS                #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+#------------------------------------------------------------#
+#   Mutable search state with an undo trail                  #
+#------------------------------------------------------------#
+#  - geometry holds the precomputed tables of the board size #
+#  - values holds the cells row by row, 0 for blanks         #
+#  - candidates holds a bitmask per cell, bit (value - 1) is #
+#    set when value can still be placed in the cell. Python  #
+#    ints are used as bitsets, so 16x16 and 25x25 boards     #
+#    need no other representation                            #
+#  - trail records (cell, candidates) before every change of #
+#    a blank cell, so undo(mark) rolls the state back to the #
+#    point where len(trail) was mark without copying         #
+#------------------------------------------------------------#
+class SearchState:
+
+    __slots__ = ("geometry", "values", "candidates", "trail")
+
+    def __init__(self, board):
+        self.geometry = geometry = get_geometry(get_box_size(board))
+        rows, columns, boxes = get_used_masks(board)
+
+        self.values = [int(value) for value in np.ravel(board)]
+        self.candidates = [0] * geometry.cells
+        self.trail = []
+
+        for cell, value in enumerate(self.values):
+            row, column = divmod(cell, geometry.size)
+            if value:
+                self.candidates[cell] = 1 << (value - 1)
+            else:
+                used = rows[row] | columns[column] | boxes[geometry.box_index[cell]]
+                self.candidates[cell] = ~used & geometry.full_mask
+
+    #--------------------------------------------------------#
+    #  Builds a state from a board and the candidate masks   #
+    #  of its cells, such as those of propagate_batch,       #
+    #  instead of deriving the masks from the board          #
+    #--------------------------------------------------------#
+    @classmethod
+    def from_candidates(cls, board, candidates):
+        state = cls.__new__(cls)
+        state.geometry = get_geometry(get_box_size(board))
+        state.values = np.ravel(board).tolist()
+        state.candidates = np.ravel(candidates).tolist()
+        state.trail = []
+        return state
+
+    #--------------------------------------------------------#
+    #  Assigns value to cell and removes it from the         #
+    #  candidates of the cell's peers (forward checking)     #
+    #  - Returns False if a peer is left without candidates  #
+    #--------------------------------------------------------#
+    def assign(self, cell, value):
+        candidates = self.candidates
+        trail = self.trail
+        bit = 1 << (value - 1)
+
+        trail.append((cell, candidates[cell]))
+        self.values[cell] = value
+        candidates[cell] = bit
+
+        for peer in self.geometry.cell_peers[cell]:
+            if candidates[peer] & bit and not self.values[peer]:
+                trail.append((peer, candidates[peer]))
+                candidates[peer] ^= bit
+                if not candidates[peer]:
+                    return False
+
+        return True
+
+    #--------------------------------------------------------#
+    #  Checks that no two givens share a value in a row,     #
+    #  column or box                                         #
+    #--------------------------------------------------------#
+    def is_consistent(self):
+        values = self.values
+        cell_peers = self.geometry.cell_peers
+        for cell, value in enumerate(values):
+            if value:
+                for peer in cell_peers[cell]:
+                    if values[peer] == value:
+                        return False
+
+        return True
+
+    #--------------------------------------------------------#
+    #  Removes the bits of mask from a blank cell's          #
+    #  candidates                                            #
+    #  - Returns False if the cell is left without candidates#
+    #--------------------------------------------------------#
+    def eliminate(self, cell, mask):
+        candidates = self.candidates
+        if candidates[cell] & mask:
+            self.trail.append((cell, candidates[cell]))
+            candidates[cell] &= ~mask
+            if not candidates[cell]:
+                return False
+
+        return True
+
+    #--------------------------------------------------------#
+    #  Applies naked and hidden singles, and optionally      #
+    #  naked pairs and pointing pairs, until nothing changes #
+    #  - Returns False as soon as a contradiction is found   #
+    #--------------------------------------------------------#
+    def propagate(self, pairs=False):
+        candidates = self.candidates
+        values = self.values
+        full_mask = self.geometry.full_mask
+        bit_count = int.bit_count
+
+        changed = True
+        while changed:
+            changed = False
+
+            # Naked singles: blank cells with one candidate left
+            for cell, value in enumerate(values):
+                if not value:
+                    if not candidates[cell]:
+                        return False
+                    if bit_count(candidates[cell]) == 1:
+                        if not self.assign(cell, lowest_digit(candidates[cell])):
+                            return False
+                        changed = True
+
+            # Hidden singles: values with one place left in a unit
+            for unit in self.geometry.unit_cells:
+                seen_once = seen_twice = placed = 0
+                for cell in unit:
+                    seen_twice |= seen_once & candidates[cell]
+                    seen_once |= candidates[cell]
+                    if values[cell]:
+                        placed |= candidates[cell]
+                if seen_once != full_mask:
+                    return False
+
+                hidden = seen_once & ~seen_twice & ~placed
+                while hidden:
+                    bit = hidden & -hidden
+                    hidden ^= bit
+                    for cell in unit:
+                        if candidates[cell] & bit:
+                            break
+                    else:
+                        return False
+                    if values[cell]:
+                        continue
+                    if not self.assign(cell, lowest_digit(bit)):
+                        return False
+                    changed = True
+
+            if pairs and not changed:
+                result = self.eliminate_pairs()
+                if result is None:
+                    return False
+                changed = result
+
+        return True
+
+    #--------------------------------------------------------#
+    #  Applies naked pairs in every unit and pointing pairs  #
+    #  from every box to its rows and columns                #
+    #  - Returns True if a candidate was removed, False if   #
+    #    nothing changed and None on a contradiction         #
+    #--------------------------------------------------------#
+    def eliminate_pairs(self):
+        candidates = self.candidates
+        values = self.values
+        size = self.geometry.size
+        unit_cells = self.geometry.unit_cells
+        changed = False
+
+        # Naked pairs: two cells of a unit with the same two candidates
+        for unit in unit_cells:
+            blanks = [cell for cell in unit if not values[cell]]
+            pairs = [candidates[cell] for cell in blanks if candidates[cell].bit_count() == 2]
+            for mask in set(pairs):
+                if pairs.count(mask) != 2:
+                    continue
+                for cell in blanks:
+                    if candidates[cell] != mask and candidates[cell] & mask:
+                        if not self.eliminate(cell, mask):
+                            return None
+                        changed = True
+
+        # Pointing pairs: a value confined to one row or column of a box
+        for box in range(size):
+            box_blanks = [cell for cell in unit_cells[2*size + box] if not values[cell]]
+            for value in range(1, size + 1):
+                bit = 1 << (value - 1)
+                cells = [cell for cell in box_blanks if candidates[cell] & bit]
+                if len(cells) < 2:
+                    continue
+                if len({cell // size for cell in cells}) == 1:
+                    line = unit_cells[cells[0] // size]
+                elif len({cell % size for cell in cells}) == 1:
+                    line = unit_cells[size + cells[0] % size]
+                else:
+                    continue
+                for cell in line:
+                    if not values[cell] and cell not in cells and candidates[cell] & bit:
+                        if not self.eliminate(cell, bit):
+                            return None
+                        changed = True
+
+        return changed
+
+    #--------------------------------------------------------#
+    #  Rolls back every change recorded after mark           #
+    #--------------------------------------------------------#
+    def undo(self, mark):
+        candidates = self.candidates
+        values = self.values
+        trail = self.trail
+
+        while len(trail) > mark:
+            cell, cell_candidates = trail.pop()
+            candidates[cell] = cell_candidates
+            values[cell] = 0
+
+    #--------------------------------------------------------#
+    #  Selects the blank cell with least candidates (MRV)    #
+    #  - Returns -1 if every cell is assigned                #
+    #--------------------------------------------------------#
+    def select_unassigned_cell(self):
+        candidates = self.candidates
+        bit_count = int.bit_count
+        min_len = self.geometry.size + 1
+        selected = -1
+
+        for cell, value in enumerate(self.values):
+            if not value:
+                count = bit_count(candidates[cell])
+                if count < min_len:
+                    min_len = count
+                    selected = cell
+                    if count <= 1:
+                        break
+
+        return selected
+
+#------------------------------------------------------------#
+#   Function to find solution or return failure on a single  #
+#   mutable search state                                     #
+#------------------------------------------------------------#
+#  - Takes SearchState and pairs flag as input, and the      #
+#    SearchStats to fill, the SearchLimits to check at every #
+#    node and the OrderRun of cells and values               #
+#  - Depth-first search driven by an explicit stack of       #
+#    (cell, remaining candidates, trail mark) frames, one    #
+#    per decision, so the depth is not bound by the          #
+#    recursion limit and no Python frame is built per node   #
+#  - Every value tried is assigned in place, propagated and  #
+#    rolled back through the trail on failure                #
+#  - Returns True once the state holds a solution, False on  #
+#    failure                                                 #
+#------------------------------------------------------------#
+
+
+def backtrack_bitmask(state, pairs=False, stats=None, limits=None, order=None):
+    stack = []
+
+    while True:
+        if order is None:
+            cell = state.select_unassigned_cell()
+        else:
+            cell = select_bitmask_cell(state, order)
+        if cell == -1:
+            return True
+        if limits is not None:
+            limits.check()
+
+        # Remaining candidates are a bitmask tried from the lowest
+        # bit, or with an OrderRun a reversed list of bits
+        if order is None:
+            remaining = state.candidates[cell]
+        else:
+            remaining = order_bitmask_values(state, cell, order)[::-1]
+        mark = len(state.trail)
+        if stats is not None:
+            stats.choice(len(stack), state.candidates[cell].bit_count())
+
+        # Trying the candidates in order, going back to the frame
+        # of the previous decision when they run out
+        while True:
+            if not remaining:
+                if not stack:
+                    return False
+                cell, remaining, mark = stack.pop()
+                state.undo(mark)
+                if stats is not None:
+                    stats.backtracks += 1
+                continue
+
+            if order is None:
+                bit = remaining & -remaining
+                remaining ^= bit
+            else:
+                bit = remaining.pop()
+
+            if stats is None:
+                if state.assign(cell, lowest_digit(bit)) and state.propagate(pairs):
+                    break
+            else:
+                stats.decisions += 1
+                if state.assign(cell, lowest_digit(bit)) and stats.propagate(state, pairs):
+                    break
+                stats.backtracks += 1
+            state.undo(mark)
+
+        stack.append((cell, remaining, mark))
+
+#------------------------------------------------------------#
+#      Function to get row, column and box used bitmasks     #
+#------------------------------------------------------------#
+#  - Takes board as input                                    #
+#  - Returns three lists of bitmasks for rows, columns and   #
+#    boxes                                                   #
+#------------------------------------------------------------#
+
+
+def get_used_masks(board):
+    box_size = get_box_size(board)
+    size = box_size * box_size
+    rows = [0] * size
+    columns = [0] * size
+    boxes = [0] * size
+
+    for row, column in zip(*np.nonzero(board)):
+        bit = 1 << (int(board[row, column]) - 1)
+        rows[row] |= bit
+        columns[column] |= bit
+        boxes[get_box_index(row, column, box_size)] |= bit
+
+    return rows, columns, boxes
+
+#------------------------------------------------------------#
+#             Function to get a variable's box index         #
+#------------------------------------------------------------#
+#  - Takes variable's position and box size as input         #
+#  - Returns index of the box, counted row by row            #
+#------------------------------------------------------------#
+
+
+def get_box_index(row, column, box_size=3):
+    return box_size*(row//box_size) + column//box_size
+
+#------------------------------------------------------------#
+#          Function to get the value of a single bit         #
+#------------------------------------------------------------#
+#  - Takes a bitmask with only one bit set as input          #
+#  - Returns the domain value represented by that bit        #
+#------------------------------------------------------------#
+
+
+def lowest_digit(bit):
+    return bit.bit_length()
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                   BOARD GEOMETRY FUNCTIONS                 #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+# Precomputed tables of a board with boxes of box_size x
+# box_size cells, so the board is size x size with size =
+# box_size**2. Cells are numbered row by row.
+#  - full_mask has all size values set
+#  - unit_cells lists the cells of the rows, then columns,
+#    then boxes
+#  - cell_peers lists the 3*size - 2*box_size - 1 cells
+#    sharing a row, column or box with each cell
+#  - box_index is the box of each cell
+#  - peer_array, cell_units and unit_array hold the peers of
+#    each cell, the 3 units of each cell and the cells of each
+#    unit as compact numpy arrays for vectorized lookups
+Geometry = namedtuple("Geometry", ["box_size", "size", "cells", "full_mask",
+                                   "unit_cells", "cell_peers", "box_index",
+                                   "peer_array", "cell_units", "unit_array"])
+
+#------------------------------------------------------------#
+#        Function to get the tables of a board size          #
+#------------------------------------------------------------#
+#  - Takes box size as input                                 #
+#  - Returns Geometry, built once per box size               #
+#------------------------------------------------------------#
+
+
+@lru_cache(maxsize=None)
+def get_geometry(box_size):
+    size = box_size * box_size
+    cells = size * size
+    box_index = [get_box_index(row, column, box_size)
+                 for row in range(size) for column in range(size)]
+
+    unit_cells = ([[size*row + column for column in range(size)] for row in range(size)] +
+                  [[size*row + column for row in range(size)] for column in range(size)] +
+                  [[cell for cell in range(cells) if box_index[cell] == box] for box in range(size)])
+
+    cell_peers = []
+    for cell in range(cells):
+        row, column = divmod(cell, size)
+        peers = set(unit_cells[row] + unit_cells[size + column] + unit_cells[2*size + box_index[cell]])
+        peers.discard(cell)
+        cell_peers.append(sorted(peers))
+
+    cell_units = [[cell // size, size + cell % size, 2*size + box_index[cell]] for cell in range(cells)]
+
+    return Geometry(box_size, size, cells, (1 << size) - 1, unit_cells, cell_peers, box_index,
+                    get_index_array(cell_peers), get_index_array(cell_units),
+                    get_index_array(unit_cells))
+
+#------------------------------------------------------------#
+#        Function to store a table of cell indices           #
+#------------------------------------------------------------#
+#  - Takes list of equally long lists of indices as input    #
+#  - Returns read-only numpy array of the smallest integer   #
+#    type that holds the largest index                       #
+#------------------------------------------------------------#
+
+
+def get_index_array(table):
+    largest = max(max(row) for row in table)
+    array = np.array(table, dtype=np.int16 if largest < 2**15 else np.int32)
+    array.flags.writeable = False
+    return array
+
+#------------------------------------------------------------#
+#          Function to get the box size of a board           #
+#------------------------------------------------------------#
+#  - Takes n^2 x n^2 board as input                          #
+#  - Returns n                                               #
+#  - Raises ValueError if the board is not square with a     #
+#    square side                                             #
+#------------------------------------------------------------#
+
+
+def get_box_size(board):
+    shape = np.shape(board)
+    box_size = isqrt(shape[0]) if len(shape) == 2 else 0
+    if box_size < 1 or shape != (box_size*box_size, box_size*box_size):
+        raise ValueError("board must be n^2 x n^2, got shape {}".format(shape))
+
+    return box_size
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                 SOLUTION COUNTING FUNCTIONS                #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+
+def count_solutions(board, limit=2):
+    """
+    Counts the solutions of a Sudoku puzzle, stopping early at limit.
+
+    Input
+        board : n^2 x n^2 numpy array
+            Empty cells are designated by 0. The array is not modified.
+            Raises ValueError if it holds values outside 0 to n^2.
+        limit : int or None
+            Stop searching once this many solutions are found, None counts
+            every solution.
+
+    Output
+        int
+            Number of solutions found, at most limit. 0 if the givens
+            conflict or there is no solution.
+    """
+    if limit is None:
+        limit = float("inf")
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    if not check_count_board(board):
+        return 0
+
+    state = SearchState(board)
+    if not (state.is_consistent() and state.propagate()):
+        return 0
+
+    return count_bitmask(state, limit)
+
+
+def is_unique(board):
+    """
+    Checks whether a Sudoku puzzle has exactly one solution.
+
+    Input
+        board : n^2 x n^2 numpy array
+            Empty cells are designated by 0. The array is not modified.
+            Raises ValueError if it holds values outside 0 to n^2.
+
+    Output
+        bool
+            True if the puzzle has one solution, False if it has none or
+            more than one.
+    """
+    return count_solutions(board, limit=2) == 1
+
+#------------------------------------------------------------#
+#       Function to check a board before counting it         #
+#------------------------------------------------------------#
+#  - Takes board as input                                    #
+#  - Returns true if the board is valid, false if its givens #
+#    repeat a value, which leaves no solution to count       #
+#  - Raises ValueError if the board is not n^2 x n^2 or      #
+#    holds values outside 0 to n^2                           #
+#------------------------------------------------------------#
+
+
+def check_count_board(board):
+    board = np.asarray(board)
+    size = get_box_size(board) ** 2
+    if is_valid_board(board):
+        return True
+
+    if np.any((board < 0) | (board > size)):
+        raise ValueError("cell values must be 0 to {}, got {} to {}".format(
+            size, board.min(), board.max()))
+    return False
+
+#------------------------------------------------------------#
+#   Function to count solutions on a single mutable search   #
+#   state                                                    #
+#------------------------------------------------------------#
+#  - Takes SearchState, limit and SearchLimits as input      #
+#  - Same explicit stack search as backtrack_bitmask, but a  #
+#    solution is treated as a dead end, so the search        #
+#    carries on until limit solutions are found              #
+#  - Returns number of solutions found, at most limit        #
+#------------------------------------------------------------#
+
+
+def count_bitmask(state, limit, limits=None):
+    count = 0
+    stack = []
+
+    while True:
+        cell = state.select_unassigned_cell()
+        if cell == -1:
+            count += 1
+            if count >= limit:
+                return count
+            remaining = 0
+        else:
+            if limits is not None:
+                limits.check()
+            remaining = state.candidates[cell]
+            mark = len(state.trail)
+
+        while True:
+            if not remaining:
+                if not stack:
+                    return count
+                cell, remaining, mark = stack.pop()
+                state.undo(mark)
+                continue
+
+            bit = remaining & -remaining
+            remaining ^= bit
+
+            if state.assign(cell, lowest_digit(bit)) and state.propagate():
+                break
+            state.undo(mark)
+
+        stack.append((cell, remaining, mark))
+
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                DANCING LINKS (ALGORITHM X)                 #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+
+#------------------------------------------------------------#
+#   Sudoku as an exact cover problem solved with Knuth's     #
+#   Algorithm X on dancing links                             #
+#------------------------------------------------------------#
+#  - For a size x size board (324 columns at 9x9): every     #
+#    cell holds a value, and every row, column and box holds #
+#    every value once                                        #
+#  - size^3 candidate rows (729 at 9x9), row id              #
+#    size*cell + (value - 1), each covering one column of    #
+#    each of the four kinds                                  #
+#  - Nodes live in flat lists of left, right, up, down and   #
+#    column links, node 0 is the root and the next nodes are #
+#    the column headers                                      #
+#  - Building the links is most of the cost of an easy       #
+#    solve, so get_exact_cover keeps one instance per box    #
+#    size and every solve works on a copy of it              #
+#------------------------------------------------------------#
+class ExactCover:
+
+    __slots__ = ("board_size", "left", "right", "up", "down", "column", "row_id", "size",
+                 "row_nodes")
+
+    def __init__(self, box_size=3):
+        geometry = get_geometry(box_size)
+        board_size = geometry.size
+        cells = geometry.cells
+        columns = 4 * cells
+
+        self.board_size = board_size
+        self.left = list(range(-1, columns))
+        self.right = list(range(1, columns + 2))
+        self.left[0] = columns
+        self.right[columns] = 0
+        self.up = list(range(columns + 1))
+        self.down = list(range(columns + 1))
+        self.column = list(range(columns + 1))
+        self.row_id = [-1] * (columns + 1)
+        self.size = [0] * (columns + 1)
+        self.row_nodes = []
+
+        for row_id in range(cells * board_size):
+            cell, value = divmod(row_id, board_size)
+            row, column = divmod(cell, board_size)
+            first = len(self.column)
+            self.row_nodes.append(first)
+            for header in (1 + cell,
+                           1 + cells + board_size*row + value,
+                           1 + 2*cells + board_size*column + value,
+                           1 + 3*cells + board_size*geometry.box_index[cell] + value):
+                self.append_node(header, row_id, first)
+
+    #--------------------------------------------------------#
+    #  Returns a copy that can be covered independently, the #
+    #  links a search never changes are shared               #
+    #--------------------------------------------------------#
+    def copy(self):
+        other = ExactCover.__new__(ExactCover)
+        other.board_size = self.board_size
+        other.left = self.left.copy()
+        other.right = self.right.copy()
+        other.up = self.up.copy()
+        other.down = self.down.copy()
+        other.column = self.column
+        other.row_id = self.row_id
+        other.size = self.size.copy()
+        other.row_nodes = self.row_nodes
+        return other
+
+    #--------------------------------------------------------#
+    #  Adds a node at the bottom of a column and at the end  #
+    #  of the candidate row starting at node first           #
+    #--------------------------------------------------------#
+    def append_node(self, header, row_id, first):
+        node = len(self.column)
+        self.column.append(header)
+        self.row_id.append(row_id)
+
+        self.up.append(self.up[header])
+        self.down.append(header)
+        self.down[self.up[header]] = node
+        self.up[header] = node
+        self.size[header] += 1
+
+        if node == first:
+            self.left.append(node)
+            self.right.append(node)
+        else:
+            self.left.append(self.left[first])
+            self.right.append(first)
+            self.right[self.left[first]] = node
+            self.left[first] = node
+
+    #--------------------------------------------------------#
+    #  Removes a column and every row that covers it         #
+    #--------------------------------------------------------#
+    def cover(self, header):
+        left, right, up, down = self.left, self.right, self.up, self.down
+        column, size = self.column, self.size
+
+        right[left[header]] = right[header]
+        left[right[header]] = left[header]
+        i = down[header]
+        while i != header:
+            j = right[i]
+            while j != i:
+                down[up[j]] = down[j]
+                up[down[j]] = up[j]
+                size[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    #--------------------------------------------------------#
+    #  Restores a column removed by cover, in reverse order  #
+    #--------------------------------------------------------#
+    def uncover(self, header):
+        left, right, up, down = self.left, self.right, self.up, self.down
+        column, size = self.column, self.size
+
+        i = up[header]
+        while i != header:
+            j = left[i]
+            while j != i:
+                size[column[j]] += 1
+                down[up[j]] = j
+                up[down[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[header]] = header
+        left[right[header]] = header
+
+    #--------------------------------------------------------#
+    #  Covers the givens of the board and searches for the   #
+    #  remaining rows                                        #
+    #  - Returns list of the row ids of a solution, or None  #
+    #    if the givens conflict or there is no solution      #
+    #--------------------------------------------------------#
+    def solve(self, board, stats=None, limits=None):
+        solution = []
+        covered = set()
+
+        for cell, value in enumerate(np.ravel(board)):
+            if value:
+                row_id = self.board_size*cell + int(value) - 1
+                node = self.row_nodes[row_id]
+                headers = [self.column[node + k] for k in range(4)]
+                if covered.intersection(headers):
+                    return None
+                covered.update(headers)
+                for header in headers:
+                    self.cover(header)
+                solution.append(row_id)
+
+        if self.search(solution, stats, limits=limits):
+            return solution
+        return None
+
+    #--------------------------------------------------------#
+    #  Algorithm X: covers the column with fewest rows and   #
+    #  tries each of its rows in turn                        #
+    #  - The chosen rows are kept on an explicit stack of    #
+    #    (column, row node) frames instead of recursing      #
+    #  - Fills stats, if given, with depth as the number of  #
+    #    rows chosen so far, and checks limits at every node #
+    #  - Returns True once every column is covered           #
+    #--------------------------------------------------------#
+    def search(self, solution, stats=None, limits=None):
+        right, left, down, size = self.right, self.left, self.down, self.size
+        stack = []
+
+        while True:
+            header = right[0]
+            if header == 0:
+                return True
+            if limits is not None:
+                limits.check()
+
+            # Choosing the column with the fewest rows left
+            selected = header
+            while header != 0:
+                if size[header] < size[selected]:
+                    selected = header
+                    if size[selected] <= 1:
+                        break
+                header = right[header]
+
+            if size[selected] == 0:
+                node = None
+            else:
+                if stats is not None:
+                    stats.choice(len(stack), size[selected])
+                self.cover(selected)
+                node = down[selected]
+
+            # Going back up the stack until a column has a row left
+            while True:
+                if node is None:
+                    if not stack:
+                        return False
+                    selected, node = stack.pop()
+                    if stats is not None:
+                        stats.backtracks += 1
+                    solution.pop()
+                    j = left[node]
+                    while j != node:
+                        self.uncover(self.column[j])
+                        j = left[j]
+                    node = down[node]
+
+                if node == selected:
+                    self.uncover(selected)
+                    node = None
+                    continue
+                break
+
+            solution.append(self.row_id[node])
+            j = right[node]
+            while j != node:
+                self.cover(self.column[j])
+                j = right[j]
+            if stats is not None:
+                stats.decisions += 1
+            stack.append((selected, node))
+
+#------------------------------------------------------------#
+#   Function to get the uncovered exact cover of a box size  #
+#------------------------------------------------------------#
+#  - Takes box size as input                                 #
+#  - Returns the shared ExactCover, which must not be        #
+#    covered itself: solve on exact_cover.copy()             #
+#------------------------------------------------------------#
+
+
+@lru_cache(maxsize=None)
+def get_exact_cover(box_size):
+    return ExactCover(box_size)
+
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
 #                 INFERENCE RELATED FUNCTIONS                #
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
@@ -166,8 +2511,11 @@ def backtrack(board, variables, domains):
 #     Function to get all inferences of a board variable     #
 #------------------------------------------------------------#
 #  - Takes board, row, column, value at row-column as input  #
-#  - Returns a list of tuples with variable's position       #
+#  - Places single values on the board until none is left    #
+#    and returns a list of tuples with variable's position   #
 #    and domains                                             #
+#  - Returns failure and leaves the board unchanged when a   #
+#    variable's domain becomes empty                         #
 #------------------------------------------------------------#
 
 
@@ -182,7 +2530,7 @@ def get_inference(board, row, column, value):
     # Getting the connected variables
     variables = get_connected_variables(board, row, column)
     # Getting the connected variable's domains
-    domains = get_connected_variables_domain(board, row, column)
+    domains = get_connected_variables_domain(board, row, column, variables)
 
     # Iterating over the domain
     for i, domain in enumerate(domains):
@@ -197,7 +2545,7 @@ def get_inference(board, row, column, value):
         if len(domain[0]) == 1:
             single_values.append((variable, domain))
 
-    # Iterating over the single_values list
+    # Iterating over the single_values list until no single value is left
     while len(single_values) != 0:
         s_value = single_values.pop(0)
         # Unpacking variable and domain as s_var and s_val
@@ -205,10 +2553,20 @@ def get_inference(board, row, column, value):
         # Unpacking s_var as row and column
         row, column = s_var
 
+        # Skipping variables already assigned by an earlier single value
+        if board[row, column] != 0:
+            continue
+
+        # Recalculating the domain, earlier single values may have emptied it
+        s_val = get_domain(board, [(row, column)])
+        if len(s_val[0]) == 0:
+            undo_inferences(board, inferences)
+            return failure
+
         # Adding single values to the inferences list
         inferences.append((s_var, s_val))
         # Assinging the value to the board
-        board[row, column] = s_val[0]
+        board[row, column] = s_val[0][0]
 
         #------------------------------#
         # Implementing forward checking#
@@ -216,24 +2574,37 @@ def get_inference(board, row, column, value):
         # Getting the connected variables of the single_values
         variables = get_connected_variables(board, row, column)
         # Getting the connected variable's domains of the single_values
-        domains = get_connected_variables_domain(board, row, column)
+        domains = get_connected_variables_domain(board, row, column, variables)
 
         # Iterating over the the connected variable's domains of the single_values
-        for domain in domains:
-            # If the domain is emoty then return blank list
+        for i, domain in enumerate(domains):
+            # If the domain is empty then undo the assignments and return failure
             if len(domain[0]) == 0:
-                return []
+                undo_inferences(board, inferences)
+                return failure
             # If the domain has single value then append it to single_values list
             if len(domain[0]) == 1:
-                single_values.append((variable, domain))
+                single_values.append((variables[i], domain))
 
-        break
     return inferences
 
+#------------------------------------------------------------#
+#     Function to remove inferences from the board           #
+#------------------------------------------------------------#
+#  - Takes board and list of inferences as input             #
+#  - Resets the inferred variables to 0                      #
+#------------------------------------------------------------#
+
+
+def undo_inferences(board, inferences):
+    for variable, variable_value in inferences:
+        board[variable[0], variable[1]] = 0
+
 #------------------------------------------------------------#
 #  Function to get all connected variable's combined domain  #
 #------------------------------------------------------------#
-#  - Takes board and variables's position as input           #
+#  - Takes board, variables's position and optionally the    #
+#    connected variables already found as input              #
 #  - Returns combined domain of all connected variables      #
 #    Connected variables means all the variables in the      #
 #    respective row, column and box for a given variable     #
@@ -241,9 +2612,10 @@ def get_inference(board, row, column, value):
 #------------------------------------------------------------#
 
 
-def get_connected_variables_domain(board, row, column):
+def get_connected_variables_domain(board, row, column, variables=None):
     domain = []
-    variables = get_connected_variables(board, row, column)
+    if variables is None:
+        variables = get_connected_variables(board, row, column)
     for variable in variables:
         row = variable[0]
         column = variable[1]
@@ -258,25 +2630,24 @@ def get_connected_variables_domain(board, row, column):
 #           Function to get all connected variables          #
 #------------------------------------------------------------#
 #  - Takes board and variables's position as input           #
-#  - Returns combined list of tuples of connected variables  #
+#  - Returns array of (row, column) rows of connected        #
+#    variables in board order                                #
 #    Connected variables means all the variables in the      #
 #    respective row, column and box for a given variable     #
-#    position on board                                       #
+#    position on board, other than the position itself       #
+#  - The peers come from the precomputed peer table, so no   #
+#    lists are built or deduplicated                         #
 #------------------------------------------------------------#
 
 
 def get_connected_variables(board, row, column):
-    connected_vars = []
-    connected_variables = np.array([])
-
-    # Creating single list of tuples of row, column and box variables
-    connected_vars = get_row_variables(board, row, column) + get_column_variables(
-        board, row, column) + get_box_variables(board, row, column)
+    size = len(board)
+    peers = get_geometry(isqrt(size)).peer_array[size*row + column]
 
-    # Converting to numpy array and returning unique numpy array
-    connected_variables = connected_vars
+    # Keeping the peers that are still blank
+    connected_variables = peers[np.ravel(board)[peers] == 0]
 
-    return np.unique(connected_variables, axis=0)
+    return np.column_stack(np.divmod(connected_variables, size))
 
 
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
@@ -355,68 +2726,15 @@ def get_variables(board):
 
 
 #------------------------------------------------------------#
-#               Function to get Row variables                #
+#                Function to identify n*n Box                #
 #------------------------------------------------------------#
 #  - Takes board and variables's position as input           #
-#  - Returns list of tuples of row variables                 #
-#------------------------------------------------------------#
-
-
-def get_row_variables(board, row, column):
-
-    row_variables = []
-    row_vars = np.where(board[row, :] == 0)
-
-    for i in range(len(row_vars[0])):
-        row_variables.append((row, row_vars[0][i]))
-
-    return row_variables
-
-#------------------------------------------------------------#
-#               Function to get Column variables             #
-#------------------------------------------------------------#
-#  - Takes board and variables's position as input           #
-#  - Returns list of tuples of column variables              #
-#------------------------------------------------------------#
-
-
-def get_column_variables(board, row, column):
-
-    column_variables = []
-    col_vars = np.where(board[:, column] == 0)
-
-    for i in range(len(col_vars[0])):
-        column_variables.append((col_vars[0][i], column))
-
-    return column_variables
-
-#------------------------------------------------------------#
-#                Function to get Box variables               #
-#------------------------------------------------------------#
-#  - Takes board and variables's position as input           #
-#  - Returns list of tuples of box variables                 #
-#------------------------------------------------------------#
-
-
-def get_box_variables(board, row, column):
-    box_variables = []
-
-    for x in range(3*(row//3), 3+3*(row//3)):
-        for y in range(3*(column//3), 3+3*(column//3)):
-            if board[x, y] == 0:
-                box_variables.append((x, y))
-
-    return box_variables
-
-
-#------------------------------------------------------------#
-#                Function to identify 3*3 Box                #
-#------------------------------------------------------------#
-#  - Takes board and variables's position as input           #
-#  - Returns box for the given variable's position           #
+#  - Returns box for the given variable's position, 3*3 on a #
+#    9x9 board                                               #
 #------------------------------------------------------------#
 def get_box(board, row, column):
-    return board[3*(row//3):3+3*(row//3), 3*(column//3):3+3*(column//3)]
+    n = isqrt(len(board))
+    return board[n*(row//n):n+n*(row//n), n*(column//n):n+n*(column//n)]
 
 
 #++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
@@ -462,7 +2780,7 @@ def get_variable_domain(board, row, column):
 
 
 def get_row_domain(board, row):
-    return np.setdiff1d(domain, board[row, :])
+    return np.setdiff1d(get_full_domain(len(board)), board[row, :])
 
 
 #------------------------------------------------------------#
@@ -474,7 +2792,7 @@ def get_row_domain(board, row):
 #------------------------------------------------------------#
 def get_column_domain(board, column):
 
-    return np.setdiff1d(domain, board[:, column])
+    return np.setdiff1d(get_full_domain(len(board)), board[:, column])
 
 #------------------------------------------------------------#
 #                  Function to get Box domain                #
@@ -487,82 +2805,86 @@ def get_column_domain(board, column):
 
 def get_box_domain(board, row, column):
     box = get_box(board, row, column)
-    return np.setdiff1d(domain, box)
-
-#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
-#                 CONSTRAINTS CHECK FUNCTIONS                #
-#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+    return np.setdiff1d(get_full_domain(len(board)), box)
 
 #------------------------------------------------------------#
-#             Function to check Board constraints            #
+#              Function to get the full domain               #
 #------------------------------------------------------------#
-#  - Takes board as input                                    #
-#  - Returns true or false, after checking all constraints   #
+#  - Takes board size as input                               #
+#  - Returns array of the values 1 to size, built once per   #
+#    size                                                    #
 #------------------------------------------------------------#
 
 
-def check_board(board):
-    rows, columns = board.shape
-    for row in range(rows):
-        for column in range(columns):
-            if not check_constraints(board, row, column):
-                return False
+@lru_cache(maxsize=None)
+def get_full_domain(size):
+    domain = np.arange(1, size + 1)
+    domain.flags.writeable = False
+    return domain
 
-    return True
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
+#                 CONSTRAINTS CHECK FUNCTIONS                #
+#++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++#
 
 #------------------------------------------------------------#
-#    Function to check Row, Column and Board constraints     #
+#             Function to check Board constraints            #
 #------------------------------------------------------------#
-#  - Takes board, row and column as input                    #
-#  - Returns true or false for combined constraints for      #
-#    Row, Column and Box                                     #
+#  - Takes board as input                                    #
+#  - Returns true or false, after checking that the board is #
+#    complete and no value repeats in a row, column or box   #
 #------------------------------------------------------------#
 
 
-def check_constraints(board, row, column):
-    return np.all([check_column_constraint(board, row, column),
-                   check_row_constraint(board, row, column), check_box_constraint(
-                       board, row, column)
-                   ])
+def check_board(board):
+    return is_valid_board(board) and bool(np.all(np.asarray(board) > 0))
 
 #------------------------------------------------------------#
-#               Function to check Row constraints            #
+#        Function to check a (partial) board at once         #
 #------------------------------------------------------------#
-#  - Takes board, row and column as input                    #
-#  - Returns true or false, if count == 1                    #
+#  - Takes board as input                                    #
+#  - Returns true or false, after checking the board is      #
+#    n^2 x n^2, holds values 0 to n^2 and repeats no value   #
+#    other than 0 in any row, column or box                  #
 #------------------------------------------------------------#
 
 
-def check_row_constraint(board, row, column):
-    row_data = board[row, :]
-    count = len(row_data[row_data == board[row, column]])
+def is_valid_board(board):
+    board = np.asarray(board)
+    try:
+        get_box_size(board)
+    except ValueError:
+        return False
 
-    return count == 1
+    return bool(validate_boards(board[np.newaxis])[0])
 
 #------------------------------------------------------------#
-#            Function to check Column constraints            #
+#         Function to check a batch of boards at once        #
 #------------------------------------------------------------#
-#  - Takes board, row and column as input                    #
-#  - Returns true or false, if count == 1                    #
+#  - Takes (N, n^2, n^2) boards as input                     #
+#  - Returns (N,) boolean array, true where a board holds    #
+#    values 0 to n^2 and repeats no value other than 0 in    #
+#    any row, column or box                                  #
+#  - All units of every board are checked with one sort      #
 #------------------------------------------------------------#
 
 
-def check_column_constraint(board, row, column):
-    column_data = board[:, column]
-    count = len(column_data[column_data == board[row, column]])
+def validate_boards(boards):
+    boards = np.asarray(boards)
+    if boards.ndim != 3:
+        raise ValueError("boards must have shape (N, n^2, n^2), got {}".format(boards.shape))
+    box_size = get_box_size(np.empty(boards.shape[1:], dtype=np.int8))
+    size = box_size * box_size
 
-    return count == 1
+    count = len(boards)
+    boxes = boards.reshape(count, box_size, box_size, box_size, box_size)
+    boxes = boxes.transpose(0, 1, 3, 2, 4).reshape(count, size, size)
+    units = np.sort(np.concatenate([boards, boards.transpose(0, 2, 1), boxes], axis=1), axis=2)
 
-#------------------------------------------------------------#
-#             Function to check Box constraints              #
-#------------------------------------------------------------#
-#  - Takes board, row and column as input                    #
-#  - Returns true or false, if count == 1                    #
-#------------------------------------------------------------#
+    in_range = np.all((boards >= 0) & (boards <= size), axis=(1, 2))
+    repeated = np.any((units[:, :, 1:] == units[:, :, :-1]) & (units[:, :, 1:] > 0), axis=(1, 2))
 
+    return in_range & ~repeated
 
-def check_box_constraint(board, row, column):
-    box_data = get_box(board, row, column)
-    count = len(box_data[box_data == board[row, column]])
 
-    return count == 1
+if __name__ == "__main__":
+    sys.exit(main())
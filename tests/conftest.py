@@ -0,0 +1,29 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The modules live at the top of the repository, not in a package
+repository_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repository_directory)
+
+from benchmarks.bench import load_corpus, tiers  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def corpora():
+    return {tier: load_corpus(tier) for tier in tiers}
+
+
+def is_solution(solution, puzzle):
+    solution = np.asarray(solution)
+    digits = set(range(1, 10))
+    boxes = solution.reshape(3, 3, 3, 3).swapaxes(1, 2).reshape(9, 9)
+    return (all(set(line) == digits for lines in (solution, solution.T, boxes) for line in lines)
+            and np.array_equal(solution[puzzle != 0], puzzle[puzzle != 0]))
+
+
+@pytest.fixture
+def check_solution():
+    return is_solution
@@ -0,0 +1,76 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from sudoku_board import Board
+from sudoku_io import format_board
+from sudoku_solver import sudoku_solver
+
+
+def test_array_round_trip(corpora):
+    puzzles = corpora["hard"]
+    for puzzle, board in zip(puzzles, Board.from_arrays(puzzles)):
+        assert board == Board.from_array(puzzle)
+        assert np.array_equal(board.to_array(), puzzle)
+        assert np.array_equal(np.asarray(board), puzzle)
+        assert Board.from_string(str(board)) == board
+        assert str(board) == format_board(puzzle)
+        assert all(board[row, column] == puzzle[row, column]
+                   for row in range(9) for column in range(9))
+
+
+@pytest.mark.parametrize("value", [-1, -2])
+def test_result_boards_round_trip(value):
+    board = Board.from_array(np.full((9, 9), value))
+    assert (board.to_array() == value).all()
+    assert board[8, 8] == value
+
+
+def test_equal_boards_hash_equal(corpora):
+    puzzles = corpora["easy"]
+    first = Board.from_arrays(puzzles)
+    second = [Board(bytes(board.data)) for board in first]
+
+    assert first == second
+    assert [hash(board) for board in first] == [hash(board) for board in second]
+    assert len(set(first + second)) == len(set(map(bytes, puzzles)))
+    assert Board.from_array(puzzles[0]) != Board.from_array(puzzles[1])
+    assert pickle.loads(pickle.dumps(first[0])) == first[0]
+
+
+def test_board_is_immutable(corpora):
+    board = Board.from_array(corpora["easy"][0])
+    with pytest.raises(AttributeError):
+        board.data = bytes(41)
+    with pytest.raises(ValueError):
+        np.asarray(board, copy=False)
+
+
+def test_solving_a_board_returns_a_board(corpora, check_solution):
+    puzzle = corpora["medium"][0]
+    board = Board.from_array(puzzle)
+    solution = sudoku_solver(board, engine="bitmask")
+
+    assert isinstance(solution, Board)
+    assert board == Board.from_array(puzzle)
+    assert check_solution(solution.to_array(), puzzle)
+
+
+@pytest.mark.parametrize("data", [
+    bytes(40),                          # too short
+    bytes(40) + b"\x01",                # padding nibble set
+    b"\xa0" + bytes(40),                # cell nibble 10
+    bytes(20) + b"\x0d" + bytes(20),    # cell nibble 13
+    bytes(40) + b"\xb0",                # last cell nibble 11
+])
+def test_invalid_records_are_rejected(data):
+    with pytest.raises(ValueError):
+        Board(data)
+
+
+def test_invalid_arrays_are_rejected():
+    with pytest.raises(ValueError):
+        Board.from_array(np.zeros((16, 16), dtype=int))
+    with pytest.raises(ValueError):
+        Board.from_array(np.full((9, 9), 10))
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from sudoku_cache import SolutionCache, canonical_form, invert_transform
+from sudoku_solver import sudoku_solver
+
+variants_per_puzzle = 4
+
+#------------------------------------------------------------#
+#  Applies a random validity-preserving transformation:      #
+#  transposition, band, row, stack and column permutations   #
+#  and digit relabelling                                     #
+#------------------------------------------------------------#
+
+
+def transform_board(board, rng):
+    lines = [np.concatenate([3*group + rng.permutation(3) for group in rng.permutation(3)])
+             for _ in range(2)]
+    digits = np.concatenate([[0], rng.permutation(9) + 1])
+
+    oriented = board.T if rng.random() < 0.5 else board
+    return digits[oriented[lines[0]][:, lines[1]]]
+
+
+@pytest.fixture(scope="module")
+def variants(corpora):
+    rng = np.random.default_rng(0)
+    return [(puzzle, [transform_board(puzzle, rng) for _ in range(variants_per_puzzle)])
+            for tier in ("easy", "hard", "17-clue") for puzzle in corpora[tier]]
+
+
+def test_invert_transform_restores_variants(variants):
+    for puzzle, puzzle_variants in variants:
+        for board in [puzzle] + puzzle_variants:
+            key, canonical, transform = canonical_form(board)
+            assert key == canonical.astype(np.int8).tobytes()
+            assert np.array_equal(invert_transform(canonical, transform), board)
+
+
+def test_variants_share_canonical_form(variants):
+    for puzzle, puzzle_variants in variants:
+        key = canonical_form(puzzle)[0]
+        assert all(canonical_form(board)[0] == key for board in puzzle_variants)
+
+
+def test_cache_solves_variants_from_one_entry(variants, check_solution):
+    cache = SolutionCache(maxsize=len(variants))
+    for puzzle, puzzle_variants in variants:
+        for board in [puzzle] + puzzle_variants:
+            original = board.copy()
+            solution = cache.solve(board, engine="bitmask")
+            assert np.array_equal(board, original)
+            assert check_solution(solution, board)
+
+    info = cache.info()
+    assert info.misses == info.currsize == len(variants)
+    assert info.hits == len(variants) * variants_per_puzzle
+
+
+def test_cache_returns_failure_for_unsolvable(corpora):
+    cache = SolutionCache()
+    for puzzle in corpora["unsolvable"]:
+        assert (cache.solve(puzzle, engine="bitmask") == -1).all()
+        assert (sudoku_solver(puzzle.copy(), engine="bitmask", cache=cache) == -1).all()
+    assert cache.info().hits == len(corpora["unsolvable"])
+
+
+def test_cache_save_and_load(tmp_path, corpora):
+    path = str(tmp_path / "solutions.npz")
+    cache = SolutionCache(path=path)
+    for puzzle in corpora["medium"]:
+        cache.solve(puzzle, engine="bitmask")
+    cache.save()
+
+    loaded = SolutionCache(path=path)
+    assert loaded.info().currsize == len(corpora["medium"])
+    for puzzle in corpora["medium"]:
+        assert np.array_equal(loaded.solve(puzzle), cache.solve(puzzle))
+    assert loaded.info().misses == 0
@@ -0,0 +1,69 @@
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from sudoku_solver import count_solutions, is_unique, sudoku_solver
+
+#------------------------------------------------------------#
+#  Blanks a deadly rectangle of a solution: two rows of one  #
+#  band and two columns of different stacks holding a b / b  #
+#  a, which leaves exactly two solutions                     #
+#------------------------------------------------------------#
+
+
+def blank_deadly_rectangle(solution):
+    for band in range(3):
+        for r1, r2 in combinations(range(3*band, 3*band + 3), 2):
+            for c1, c2 in combinations(range(9), 2):
+                if (c1 // 3 != c2 // 3 and solution[r1, c1] == solution[r2, c2]
+                        and solution[r1, c2] == solution[r2, c1]):
+                    puzzle = solution.copy()
+                    puzzle[np.ix_([r1, r2], [c1, c2])] = 0
+                    return puzzle
+    return None
+
+
+@pytest.fixture(scope="module")
+def two_solution_puzzle(corpora):
+    for puzzle in corpora["easy"]:
+        blanked = blank_deadly_rectangle(sudoku_solver(puzzle.copy(), engine="bitmask"))
+        if blanked is not None:
+            return blanked
+    pytest.fail("no solution of the easy tier has a deadly rectangle")
+
+
+@pytest.mark.parametrize("tier", ["easy", "medium", "hard", "17-clue"])
+def test_corpus_puzzles_are_unique(corpora, tier):
+    for puzzle in corpora[tier]:
+        assert count_solutions(puzzle) == 1
+        assert is_unique(puzzle)
+
+
+@pytest.mark.parametrize("tier", ["invalid", "unsolvable"])
+def test_corpus_puzzles_without_solution(corpora, tier):
+    for puzzle in corpora[tier]:
+        assert count_solutions(puzzle, limit=None) == 0
+        assert not is_unique(puzzle)
+
+
+def test_count_stops_at_limit(two_solution_puzzle):
+    assert count_solutions(two_solution_puzzle, limit=None) == 2
+    assert count_solutions(two_solution_puzzle, limit=1) == 1
+    assert not is_unique(two_solution_puzzle)
+    assert count_solutions(np.zeros((9, 9), dtype=int), limit=5) == 5
+
+
+def test_count_leaves_board_unchanged(two_solution_puzzle):
+    board = two_solution_puzzle.copy()
+    count_solutions(board, limit=None)
+    assert np.array_equal(board, two_solution_puzzle)
+
+
+def test_count_rejects_bad_input():
+    with pytest.raises(ValueError):
+        count_solutions(np.zeros((9, 9), dtype=int), limit=0)
+    with pytest.raises(ValueError):
+        count_solutions(np.full((9, 9), 10))
+    with pytest.raises(ValueError):
+        count_solutions(np.zeros((9, 8), dtype=int))
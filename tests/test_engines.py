@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from benchmarks.bench import tiers
+from sudoku_solver import engines, sudoku_solver
+
+# The numpy CSP engine takes about a second per easy puzzle,
+# so it is only checked on the first puzzles of a tier
+backtrack_sample = 2
+
+
+@pytest.mark.parametrize("tier", list(tiers))
+def test_bitmask_and_dlx_agree_on_corpora(corpora, check_solution, tier):
+    for puzzle in corpora[tier]:
+        bitmask = sudoku_solver(puzzle.copy(), engine="bitmask")
+        dlx = sudoku_solver(puzzle.copy(), engine="dlx")
+
+        assert np.array_equal(bitmask, dlx)
+        if tiers[tier]:
+            assert check_solution(bitmask, puzzle)
+        else:
+            assert (bitmask == -1).all()
+
+
+@pytest.mark.parametrize("tier", ["easy", "medium", "invalid", "unsolvable"])
+def test_backtrack_agrees_on_corpus_sample(corpora, tier):
+    for puzzle in corpora[tier][:backtrack_sample]:
+        expected = sudoku_solver(puzzle.copy(), engine="bitmask")
+        assert np.array_equal(sudoku_solver(puzzle.copy(), engine="backtrack"), expected)
+
+
+@pytest.mark.parametrize("engine", engines)
+def test_engines_solve_in_place_and_copy_read_only(corpora, engine):
+    puzzle = corpora["easy"][0].copy()
+    read_only = puzzle.copy()
+    read_only.flags.writeable = False
+
+    solution = sudoku_solver(read_only, engine=engine)
+    assert np.array_equal(read_only, puzzle)
+    assert np.array_equal(sudoku_solver(puzzle, engine=engine), solution)
+    assert np.array_equal(puzzle, solution)
+
+
+def test_dlx_reuses_links_after_conflicting_givens(corpora, check_solution):
+    conflicting = corpora["invalid"][0]
+    puzzle = corpora["hard"][0]
+
+    assert (sudoku_solver(conflicting.copy(), engine="dlx") == -1).all()
+    assert check_solution(sudoku_solver(puzzle.copy(), engine="dlx"), puzzle)
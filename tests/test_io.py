@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from benchmarks.bench import corpora_directory
+from sudoku_io import (binary_to_text, create_puzzle_file, format_board, open_puzzle_file,
+                       pack_boards, parse_line, read_puzzles, text_to_binary, unpack_boards)
+from sudoku_solver import sudoku_solver
+
+
+@pytest.fixture
+def boards(corpora):
+    # Puzzles, solutions and the failure and gave up results
+    puzzles = corpora["medium"][:5]
+    solutions = [sudoku_solver(puzzle.copy(), engine="bitmask") for puzzle in puzzles]
+    results = [np.full((9, 9), -1), np.full((9, 9), -2)]
+    return np.array(list(puzzles) + solutions + results, dtype=np.int8)
+
+
+def test_text_round_trip(boards):
+    for board in boards[:-2]:
+        assert np.array_equal(parse_line(format_board(board)), board)
+    assert [format_board(board) for board in boards[-2:]] == ["-" * 81, "?" * 81]
+
+
+def test_pack_round_trip(boards):
+    records = pack_boards(boards)
+    assert records.shape == (len(boards), 41) and records.dtype == np.uint8
+    assert np.array_equal(unpack_boards(records), boards)
+
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_file_round_trip(tmp_path, packed):
+    text_path = str(tmp_path / "corpus.txt")
+    binary_path = str(tmp_path / "corpus.sdk")
+    source = "{}/medium.txt".format(corpora_directory)
+    with open(source) as corpus_file:
+        puzzles = np.array(list(read_puzzles(corpus_file)))
+
+    assert text_to_binary(source, binary_path, packed=packed) == len(puzzles)
+    records, is_packed = open_puzzle_file(binary_path)
+    assert is_packed == packed
+    assert np.array_equal(unpack_boards(records) if packed else records, puzzles)
+
+    assert binary_to_text(binary_path, text_path) == len(puzzles)
+    with open(text_path) as text_file:
+        assert np.array_equal(np.array(list(read_puzzles(text_file))), puzzles)
+
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_memmap_round_trip(tmp_path, boards, packed):
+    path = str(tmp_path / "boards.sdk")
+    records = create_puzzle_file(path, len(boards), packed=packed)
+    records[:] = pack_boards(boards) if packed else boards
+    records.flush()
+    del records
+
+    records, _ = open_puzzle_file(path)
+    assert not records.flags.writeable
+    assert np.array_equal(unpack_boards(records) if packed else records, boards)
+
+
+def test_read_only_memmap_board_is_solved_on_a_copy(tmp_path, corpora, check_solution):
+    path = str(tmp_path / "puzzles.sdk")
+    puzzle = corpora["easy"][0]
+    create_puzzle_file(path, 1)[:] = puzzle
+
+    records, _ = open_puzzle_file(path)
+    assert check_solution(sudoku_solver(records[0], engine="bitmask"), puzzle)
+    assert np.array_equal(records[0], puzzle)
+
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_empty_files(tmp_path, packed):
+    text_path = str(tmp_path / "empty.txt")
+    binary_path = str(tmp_path / "empty.sdk")
+    open(text_path, "w").close()
+
+    assert text_to_binary(text_path, binary_path, packed=packed) == 0
+    records, _ = open_puzzle_file(binary_path)
+    assert records.shape == ((0, 41) if packed else (0, 9, 9))
+    records.flush()
+
+    assert len(create_puzzle_file(binary_path, 0, packed=packed)) == 0
+    assert binary_to_text(binary_path, text_path) == 0
+    with open(text_path) as text_file:
+        assert text_file.read() == ""
+
+
+def test_open_rejects_other_files(tmp_path):
+    path = tmp_path / "puzzles.txt"
+    path.write_text("0" * 81 + "\n")
+    with pytest.raises(ValueError):
+        open_puzzle_file(str(path))